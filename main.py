@@ -8,9 +8,14 @@ from datetime import datetime
 
 from src.utils.config_loader import load_config
 from src.detection.detector import ObjectDetector
+from src.detection.sampler import MotionSampler
+from src.detection.scheduler import ResolutionScheduler
 from src.analysis.analyzer import RegionAnalyzer
+from src.analysis.tracker import Tracker
+from src.analysis.heatmap import HeatmapAccumulator
 from src.alert.alerter import AlertManager
 from src.database.db_manager import DatabaseManager
+from src.database.retention import RetentionWorker
 
 def process_image(image_path, detector, analyzer, alerter, db_manager):
     """Process a single image file"""
@@ -21,18 +26,53 @@ def process_image(image_path, detector, analyzer, alerter, db_manager):
         print(f"Error: Could not read image {image_path}")
         return
     
-    detections, detection_frame = detector.detect(image)
+    scheduler = ResolutionScheduler(detector, analyzer, 'image')
+    detections, detection_frame = scheduler.detect(image, rois=analyzer.get_inference_rois(image))
     
+    return handle_image_detections(image_path, detections, detection_frame, analyzer, alerter, db_manager)
 
+def process_images(image_paths, detector, analyzer, alerter, db_manager, batch_size=None):
+    """Process several image files using batched detection"""
+    batch_size = batch_size or detector.batch_size
+    scheduler = ResolutionScheduler(detector, analyzer, 'image')
+    results = []
+    
+    # Read images one batch at a time to bound memory use
+    for start in range(0, len(image_paths), batch_size):
+        paths = []
+        images = []
+        for image_path in image_paths[start:start + batch_size]:
+            image = cv2.imread(image_path)
+            if image is None:
+                print(f"Error: Could not read image {image_path}")
+                continue
+            paths.append(image_path)
+            images.append(image)
+        
+        if not images:
+            continue
+        
+        batch_outputs = scheduler.detect_batch(images, batch_size=batch_size,
+                                               rois=[analyzer.get_inference_rois(image) for image in images])
+        for image_path, (detections, detection_frame) in zip(paths, batch_outputs):
+            print(f"Processing image: {image_path}")
+            results.append(handle_image_detections(
+                image_path, detections, detection_frame, analyzer, alerter, db_manager))
+    
+    return results
+
+def handle_image_detections(image_path, detections, detection_frame, analyzer, alerter, db_manager):
+    """Analyze, alert, store and save the output for an already detected image"""
+    # Every image is its own source, nothing carries over from the previous one
+    analyzer.reset()
+    alerter.reset()
     analysis_results, analysis_frame = analyzer.analyze(detections, detection_frame)
     
 
-    alerts = alerter.check_and_alert(analysis_results)
+    alerter.check_and_alert(analysis_results, os.path.basename(image_path))
     
 
     db_manager.save_detection(analysis_results, detections, os.path.basename(image_path))
-    if alerts:
-        db_manager.save_alerts(alerts, os.path.basename(image_path))
     
     print(f"Total people detected: {analysis_results['total_people']}")
     for region, count in analysis_results['counts'].items():
@@ -70,8 +110,14 @@ def process_video(video_path, detector, analyzer, alerter, db_manager):
     
     # Processing each  frame 
     frame_count = 0
+    frames_processed = 0
     people_counts = []
-    process_every_n_frames = 5
+    sampler = MotionSampler(detector.config)
+    scheduler = ResolutionScheduler(detector, analyzer, 'video')
+    tracker = Tracker(detector.config)
+    heatmap = HeatmapAccumulator(detector.config, os.path.basename(video_path))
+    analyzer.reset()
+    alerter.reset()
     
     print(f"Total frames: {total_frames}")
     start_time = time.time()
@@ -83,33 +129,47 @@ def process_video(video_path, detector, analyzer, alerter, db_manager):
             break
         
         frame_count += 1
+        video_time = frame_count / fps if fps > 0 else None
         
-        # Process every nth frame
-        if frame_count % process_every_n_frames == 0:
+        # Process frames selected by the motion sampler
+        if sampler.should_process(frame):
+            frames_processed += 1
+            
             # Detect objects
-            detections, detection_frame = detector.detect(frame)
+            detections, detection_frame = scheduler.detect(frame, annotate=not tracker.enabled,
+                                                           rois=analyzer.get_inference_rois(frame))
+            if tracker.enabled:
+                detections = tracker.update(detections, frame_count)
+                detection_frame = detector.render(frame, detections)
             
             # Analyze detections
-            analysis_results, analysis_frame = analyzer.analyze(detections, detection_frame)
+            analysis_results, analysis_frame = analyzer.analyze(detections, detection_frame, video_time)
+            if heatmap.enabled:
+                heatmap.update(detections, width, height, video_time)
             
             # Check for alerts
-            alerts = alerter.check_and_alert(analysis_results)
+            alerter.check_and_alert(analysis_results, os.path.basename(video_path), video_time)
             
-            if frame_count % (process_every_n_frames * 30) == 0:
+            # Every processed frame with the background writer, otherwise every 30th
+            if db_manager.writer is not None or frames_processed % 30 == 0:
                 db_manager.save_detection(analysis_results, detections, os.path.basename(video_path))
-                if alerts:
-                    db_manager.save_alerts(alerts, os.path.basename(video_path))
             
             people_counts.append(analysis_results['total_people'])
-            
             out.write(analysis_frame)
 
-            if frame_count % (process_every_n_frames * 20) == 0:
+            if frames_processed % 20 == 0:
                 elapsed_time = time.time() - start_time
-                frames_processed = frame_count // process_every_n_frames
                 fps_processing = frames_processed / elapsed_time if elapsed_time > 0 else 0
                 progress = (frame_count / total_frames) * 100
                 print(f"Progress: {progress:.1f}% ({frame_count}/{total_frames}) - Processing speed: {fps_processing:.2f} fps")
+        elif tracker.enabled:
+            # Skipped frame: predict the tracked boxes instead of running the model
+            detections = tracker.predict(frame_count)
+            analysis_results, analysis_frame = analyzer.analyze(detections, detector.render(frame, detections),
+                                                                video_time)
+            
+            people_counts.append(analysis_results['total_people'])
+            out.write(analysis_frame)
         else:
             out.write(frame)
     
@@ -117,16 +177,24 @@ def process_video(video_path, detector, analyzer, alerter, db_manager):
     cap.release()
     out.release()
     
+    # Write the queued frames first, so the rows below follow them in id and time order
+    if db_manager.writer is not None:
+        db_manager.writer.flush()
+    
     # Save video stats
     if people_counts:
         avg_people = sum(people_counts) / len(people_counts)
         duration = total_frames / fps if fps > 0 else 0
         db_manager.save_video_stats(os.path.basename(video_path), total_frames, duration, avg_people)
+        db_manager.save_line_crossings(analysis_results.get('lines'), os.path.basename(video_path))
+    
+    if heatmap.enabled and heatmap.last_timestamp is not None:
+        print(f"Heatmap saved to: {heatmap.save_snapshot()}")
     
     # Print summary
     print("\nVideo Processing Summary:")
     print(f"Total frames: {total_frames}")
-    print(f"Processed frames: {len(people_counts)}")
+    print(f"Processed frames: {frames_processed}")
     
     if people_counts:
         print(f"Average people count: {sum(people_counts) / len(people_counts):.2f}")
@@ -134,6 +202,11 @@ def process_video(video_path, detector, analyzer, alerter, db_manager):
     
     print(f"Processed video saved to: {output_path}")
     
+    if db_manager.writer is not None:
+        metrics = db_manager.writer.metrics()
+        print(f"Detection records written: {metrics['written']} in {metrics['transactions']} transactions "
+              f"(max queue depth {metrics['max_queue_depth']}, dropped {metrics['dropped']})")
+    
     return people_counts
 
 def process_directory(directory, detector, analyzer, alerter, db_manager, file_type="image"):
@@ -153,13 +226,14 @@ def process_directory(directory, detector, analyzer, alerter, db_manager, file_t
     
     print(f"Found {len(files)} {file_type} files in {directory}")
     
+    # Images are detected in batches, videos one file at a time
+    if file_type == "image":
+        process_images(files, detector, analyzer, alerter, db_manager)
+        return
+    
     for i, file_path in enumerate(files):
         print(f"\nProcessing {i+1}/{len(files)}: {file_path}")
-        
-        if file_type == "image":
-            process_image(file_path, detector, analyzer, alerter, db_manager)
-        else:  
-            process_video(file_path, detector, analyzer, alerter, db_manager)
+        process_video(file_path, detector, analyzer, alerter, db_manager)
 
 def main():
     # Parse command line arguments
@@ -168,15 +242,35 @@ def main():
     parser.add_argument('--config', type=str, default='data/config/config.yaml', help='Path to configuration file')
     parser.add_argument('--image', action='store_true', help='Process as image instead of video')
     parser.add_argument('--batch', action='store_true', help='Process all files in directory')
+    parser.add_argument('--rebuild-rollups', action='store_true', help='Rebuild the minute and hour rollups and exit')
+    parser.add_argument('--compact', action='store_true', help='Apply the retention policy, shrink the database and exit')
     args = parser.parse_args()
     
     # Load configuration
     config = load_config(args.config)
+    
+    if args.rebuild_rollups:
+        db_manager = DatabaseManager(config)
+        print(f"Rebuilt rollups: {db_manager.rebuild_rollups()} rows")
+        db_manager.close()
+        return
+    
+    if args.compact:
+        db_manager = DatabaseManager(config)
+        # Run the policy to completion here, also when the background worker is disabled
+        if db_manager.retention is not None:
+            db_manager.retention.close()
+        retention = RetentionWorker(db_manager, config['database'].get('retention', {}), start=False)
+        print(f"Deleted: {retention.apply()}")
+        db_manager.compact()
+        print(f"Database size: {os.path.getsize(db_manager.db_path) / 1024 / 1024:.1f} MB")
+        db_manager.close()
+        return
 
     detector = ObjectDetector(config)
     analyzer = RegionAnalyzer(config)
-    alerter = AlertManager(config)
     db_manager = DatabaseManager(config)
+    alerter = AlertManager(config, db_manager)
     
     
     source = args.source
@@ -193,6 +287,21 @@ def main():
         
         print("Press 'q' to quit")
         
+        source_name = f"webcam_{source}"
+        sampler = MotionSampler(config)
+        scheduler = ResolutionScheduler(detector, analyzer, 'webcam')
+        tracker = Tracker(config)
+        heatmap = HeatmapAccumulator(config, source_name)
+        show_heatmap = False
+        if heatmap.enabled:
+            print("Press 'h' to toggle the heatmap overlay")
+        if analyzer.lines.enabled and not tracker.enabled:
+            print("Warning: counting lines need analysis.tracking enabled, no crossings will be counted")
+        detections = None
+        analysis_results = None
+        last_snapshot = time.time()
+        frame_count = 0
+        
         while True:
             ret, frame = cap.read()
             
@@ -200,22 +309,50 @@ def main():
                 print("Error reading from webcam")
                 break
             
-        
-            detections, detection_frame = detector.detect(frame)
+            frame_count += 1
             
-        
-            analysis_results, analysis_frame = analyzer.analyze(detections, detection_frame)
+            if sampler.should_process(frame):
+                detections, detection_frame = scheduler.detect(frame, annotate=not tracker.enabled,
+                                                               rois=analyzer.get_inference_rois(frame))
+                if tracker.enabled:
+                    detections = tracker.update(detections, frame_count)
+                    detection_frame = detector.render(frame, detections)
+                
+            
+                analysis_results, analysis_frame = analyzer.analyze(detections, detection_frame)
+                if heatmap.enabled:
+                    heatmap.update(detections, frame.shape[1], frame.shape[0])
+                
+                alerter.check_and_alert(analysis_results, source_name)
+            else:
+                # Skipped frame: predict tracked boxes, or reuse the last detections (not added to the statistics again)
+                if tracker.enabled:
+                    detections = tracker.predict(frame_count)
+                analysis_results, analysis_frame = analyzer.analyze(detections, detector.render(frame, detections),
+                                                                    update_stats=tracker.enabled)
             
-            alerter.check_and_alert(analysis_results)
+            # Store the cumulative line counts periodically
+            if time.time() - last_snapshot >= analyzer.lines.snapshot_interval:
+                db_manager.save_line_crossings(analysis_results.get('lines'), source_name)
+                last_snapshot = time.time()
             
+            if show_heatmap:
+                analysis_frame = heatmap.render(analysis_frame)
             cv2.imshow('Campus Monitoring', analysis_frame)
             
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord('q'):
                 break
+            if key == ord('h') and heatmap.enabled:
+                show_heatmap = not show_heatmap
         
         
         cap.release()
         cv2.destroyAllWindows()
+        if analysis_results is not None:
+            db_manager.save_line_crossings(analysis_results.get('lines'), source_name)
+        if heatmap.enabled and heatmap.last_timestamp is not None:
+            print(f"Heatmap saved to: {heatmap.save_snapshot()}")
     
     # Check if source is a directory and batch processing is enabled
     elif os.path.isdir(source) and args.batch:
@@ -230,6 +367,10 @@ def main():
     
     else:
         print(f"Error: Invalid source {source}")
+    
+    # Deliver the alerts still queued
+    alerter.close()
+    db_manager.close()
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,6 @@
 import os
 import argparse
-from main import process_image, process_video
+from main import process_images, process_video
 from src.utils.config_loader import load_config
 from src.detection.detector import ObjectDetector
 from src.analysis.analyzer import RegionAnalyzer
@@ -17,8 +17,8 @@ def main():
     config = load_config()
     detector = ObjectDetector(config)
     analyzer = RegionAnalyzer(config)
-    alerter = AlertManager(config)
     db_manager = DatabaseManager(config)
+    alerter = AlertManager(config, db_manager)
     
     # Process images
     if args.type in ['images', 'all']:
@@ -29,10 +29,8 @@ def main():
             
             if image_files:
                 print(f"Found {len(image_files)} images to process")
-                for img_file in image_files:
-                    img_path = os.path.join(images_dir, img_file)
-                    print(f"Processing image: {img_path}")
-                    process_image(img_path, detector, analyzer, alerter, db_manager)
+                img_paths = [os.path.join(images_dir, img_file) for img_file in image_files]
+                process_images(img_paths, detector, analyzer, alerter, db_manager)
             else:
                 print(f"No images found in {images_dir}")
     
@@ -51,6 +49,10 @@ def main():
                     process_video(vid_path, detector, analyzer, alerter, db_manager)
             else:
                 print(f"No videos found in {videos_dir}")
+    
+    # Deliver the alerts still queued
+    alerter.close()
+    db_manager.close()
 
 if __name__ == "__main__":
     main()
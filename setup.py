@@ -49,6 +49,8 @@ import sys
 import subprocess
 import sqlite3
 
+from src.database.schema import initialize_schema
+
 def check_dependencies():
     """Check if all required packages are installed"""
     required_imports = {
@@ -84,45 +86,9 @@ def initialize_database():
     db_path = 'data/monitoring.db'
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
+    # Same schema (and migration of older databases) as the application
     conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    # Create tables
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS detections (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT,
-        total_count INTEGER,
-        total_people INTEGER,
-        video_source TEXT,
-        detection_data TEXT
-    )
-    ''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS alerts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT,
-        region TEXT,
-        count INTEGER,
-        max_count INTEGER,
-        message TEXT,
-        video_source TEXT
-    )
-    ''')
-
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS videos (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        filename TEXT,
-        processed_timestamp TEXT,
-        total_frames INTEGER,
-        duration_seconds REAL,
-        avg_people_count REAL
-    )
-    ''')
-
-    conn.commit()
+    initialize_schema(conn)
     conn.close()
     print("Database initialized successfully.")
 
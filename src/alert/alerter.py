@@ -1,7 +1,9 @@
 import time
 import logging
 import os
-from datetime import datetime
+
+from .dispatcher import AlertDispatcher
+from .rules import RuleSet
 
 # Ensure logs directory exists
 os.makedirs('logs', exist_ok=True)
@@ -17,78 +19,48 @@ logging.basicConfig(
 )
 
 class AlertManager:
-    def __init__(self, config):
+    def __init__(self, config, db_manager=None, dispatcher=None):
         self.config = config
         self.enabled = config['alert']['enabled']
         self.cooldown = config['alert']['cooldown']
         self.methods = config['alert']['methods']
-        self.last_alert_time = {region: 0 for region in config['analysis']['regions']}
+        self.rules = RuleSet(config)
         self.logger = logging.getLogger('AlertManager')
+        # Console/log output and database storage run off the frame loop (the dispatcher can be shared)
+        self.dispatcher = dispatcher if dispatcher is not None else AlertDispatcher(config, db_manager)
         
-    def check_and_alert(self, analysis_results):
+    def reset(self):
+        """Reset the rule state (hysteresis, sustain, rates, cooldowns) for a new source"""
+        self.rules.reset()
+    
+    def check_and_alert(self, analysis_results, source="unknown", timestamp=None):
         """
         Check analysis results and trigger alerts if needed
         
         Args:
             analysis_results: Dictionary with analysis results
+            source: Video source the results belong to (stored with the alerts)
+            timestamp: Time of the frame in seconds (video time for files),
+                defaults to the current time
             
         Returns:
-            alerts_triggered: Dictionary of regions where alerts were triggered
+            alerts_triggered: Dictionary of triggered alerts by '<rule>:<region>'
         """
         if not self.enabled:
             return {}
         
-        current_time = time.time()
-        alerts_triggered = {}
-        
-        # Check for overall crowd size alert
-        total_people = analysis_results.get('total_people', 0)
-        if total_people > 50:  # Arbitrary threshold for total people
-            if current_time - self.last_alert_time.get('total', 0) > self.cooldown:
-                self.last_alert_time['total'] = current_time
-                message = f"ALERT: Large crowd detected. Total count: {total_people}"
-                
-                if self.methods.get('console', False):
-                    print(f"\n{'='*50}\n{message}\n{'='*50}\n")
-                
-                if self.methods.get('log', False):
-                    self.logger.warning(message)
-                
-                alerts_triggered['total'] = {
-                    'timestamp': datetime.now().isoformat(),
-                    'region': 'total',
-                    'count': total_people,
-                    'max_count': 50,
-                    'message': message
-                }
+        # Evaluate all compiled rules over all regions at once
+        alerts_triggered = self.rules.evaluate(analysis_results, time.time() if timestamp is None else timestamp)
         
-        # Check for region-specific alerts
-        for region_name, is_anomaly in analysis_results['anomalies'].items():
-            if is_anomaly:
-                # Check if cooldown period has passed
-                if current_time - self.last_alert_time.get(region_name, 0) > self.cooldown:
-                    self.last_alert_time[region_name] = current_time
-                    
-                    # Create alert message
-                    count = analysis_results['counts'][region_name]
-                    max_count = self.config['analysis']['regions'][region_name]['max_count']
-                    message = f"ALERT: Abnormal gathering detected in {region_name}. " \
-                              f"Current count: {count}, Maximum normal: {max_count}"
-                    
-                    # Trigger alerts based on configured methods
-                    if self.methods.get('console', False):
-                        print(f"\n{'='*50}\n{message}\n{'='*50}\n")
-                    
-                    if self.methods.get('log', False):
-                        self.logger.warning(message)
-                    
-                    # Store triggered alert
-                    alerts_triggered[region_name] = {
-                        'timestamp': datetime.now().isoformat(),
-                        'region': region_name,
-                        'count': count,
-                        'max_count': max_count,
-                        'message': message
-                    }
+        # Deliver based on configured methods
+        self.dispatcher.dispatch(alerts_triggered, source)
         
         return alerts_triggered
+    
+    def flush(self, timeout=None):
+        """Wait until the queued alerts are delivered"""
+        return self.dispatcher.flush(timeout)
+    
+    def close(self):
+        """Deliver the queued alerts and stop the dispatcher"""
+        self.dispatcher.close()
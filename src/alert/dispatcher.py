@@ -0,0 +1,157 @@
+import atexit
+import logging
+import threading
+from collections import deque
+
+from .webhook import WebhookSink
+
+class AlertDispatcher:
+    """
+    Deliver alerts to the configured outputs on a background thread
+    
+    Alerts are queued (bounded) and delivered in batches: console and log
+    output, one database transaction per source and batch, and the webhook
+    sink (which POSTs on its own flush interval). When the
+    queue is full, a new alert replaces a queued alert for the same source
+    and region (coalesce). Otherwise the oldest or the newest alert is
+    dropped, depending on the overflow policy. Queueing never blocks the
+    caller. close() (also run at exit) delivers what is still queued.
+    """
+    def __init__(self, config, db_manager=None):
+        alert_config = config['alert']
+        dispatch_config = alert_config.get('dispatch', {})
+        self.methods = alert_config['methods']
+        self.db_manager = db_manager
+        self.asynchronous = dispatch_config.get('async', True)
+        self.queue_size = dispatch_config.get('queue_size', 256)
+        self.batch_size = dispatch_config.get('batch_size', 64)
+        self.overflow = dispatch_config.get('overflow', 'drop_oldest')
+        self.logger = logging.getLogger('AlertManager')
+        self.webhook = WebhookSink(config) if self.methods.get('webhook', False) else None
+        
+        self.queue = deque()
+        self.pending = {}
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.closed = False
+        self.thread = None
+        
+        if self.asynchronous:
+            self.thread = threading.Thread(target=self._run, name='AlertDispatcher', daemon=True)
+            self.thread.start()
+        atexit.register(self.close)
+    
+    def dispatch(self, alerts, source="unknown"):
+        """
+        Queue alerts for delivery
+        
+        Args:
+            alerts: Dictionary of alerts by region (as returned by check_and_alert)
+            source: Video source the alerts belong to
+        """
+        if not alerts:
+            return
+        
+        if not self.asynchronous or self.closed:
+            self._deliver([(source, alert) for alert in alerts.values()])
+            return
+        
+        with self.condition:
+            for region, alert in alerts.items():
+                key = (source, region)
+                entry = self.pending.get(key)
+                if len(self.queue) >= self.queue_size:
+                    if entry is not None:
+                        entry[2] = alert
+                        self.coalesced += 1
+                        continue
+                    if self.overflow == 'drop_newest':
+                        self.dropped += 1
+                        continue
+                    oldest = self.queue.popleft()
+                    if self.pending.get(oldest[0]) is oldest:
+                        del self.pending[oldest[0]]
+                    self.dropped += 1
+                
+                entry = [key, source, alert]
+                self.queue.append(entry)
+                self.pending[key] = entry
+            self.condition.notify()
+    
+    def _run(self):
+        """Deliver queued alerts in batches until closed"""
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if not self.queue:
+                    return
+                
+                batch = []
+                while self.queue and len(batch) < self.batch_size:
+                    entry = self.queue.popleft()
+                    if self.pending.get(entry[0]) is entry:
+                        del self.pending[entry[0]]
+                    batch.append((entry[1], entry[2]))
+                self.in_flight = len(batch)
+            
+            try:
+                self._deliver(batch)
+            except Exception as e:
+                self.logger.error(f"Error delivering alerts: {e}")
+            
+            with self.condition:
+                self.in_flight = 0
+                self.condition.notify_all()
+    
+    def _deliver(self, batch):
+        """Deliver a batch of (source, alert) pairs to all outputs"""
+        for source, alert in batch:
+            if self.methods.get('console', False):
+                print(f"\n{'='*50}\n{alert['message']}\n{'='*50}\n")
+            
+            if self.methods.get('log', False):
+                self.logger.warning(alert['message'])
+        
+        if self.webhook is not None:
+            self.webhook.send([dict(alert, source=source) for source, alert in batch])
+        
+        if self.db_manager is not None:
+            by_source = {}
+            for source, alert in batch:
+                by_source.setdefault(source, []).append(alert)
+            for source, alerts in by_source.items():
+                self.db_manager.save_alerts(alerts, source)
+    
+    def queue_depth(self):
+        """Number of alerts waiting for delivery"""
+        with self.condition:
+            return len(self.queue)
+    
+    def flush(self, timeout=None):
+        """
+        Wait until all queued alerts are delivered
+        
+        Returns:
+            True if the queue was drained within the timeout
+        """
+        if not self.asynchronous:
+            return True
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.queue and not self.in_flight, timeout)
+    
+    def close(self, timeout=5):
+        """Deliver the queued alerts and stop the background threads"""
+        if self.closed:
+            return
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        if self.webhook is not None:
+            self.webhook.close()
+        if self.dropped or self.coalesced:
+            self.logger.info(f"Alert queue overflow: {self.dropped} dropped, {self.coalesced} coalesced")
@@ -0,0 +1,156 @@
+import numpy as np
+from datetime import datetime
+
+# Metrics a rule can watch: per region, or one value for the whole frame
+REGION_METRICS = ('count', 'rate')
+TOTAL_METRICS = ('total_people', 'total_count')
+
+DEFAULT_MESSAGES = {
+    'count': "ALERT: Abnormal gathering detected in {region}. Current count: {value}, Maximum normal: {threshold}",
+    'rate': "ALERT: Rapid change in {region}. {value:+.2f} per second, limit: {threshold}",
+    'total_people': "ALERT: Large crowd detected. Total count: {value}",
+    'total_count': "ALERT: Crowded regions. Total count in regions: {value}, limit: {threshold}"
+}
+
+def default_rules(config):
+    """Rules equivalent to the fixed checks: total people over 50 and each region over its max_count"""
+    cooldown = config['alert'].get('cooldown', 60)
+    return [
+        {'name': 'large_crowd', 'metric': 'total_people', 'threshold': 50, 'cooldown': cooldown},
+        {'name': 'region_max', 'metric': 'count', 'threshold': 'max_count', 'cooldown': cooldown}
+    ]
+
+class RuleSet:
+    """
+    Alert rules compiled into flat arrays, one slot per rule and region
+    
+    Every frame, the metric values of all slots are gathered with one index
+    operation and the thresholds, hysteresis, sustain times and cooldowns are
+    evaluated as array operations over all slots together.
+    
+    A slot turns on when its value goes above 'threshold' and only turns off
+    again when the value drops to 'release' or below (hysteresis). It fires after
+    being on for 'sustain' seconds, at most once per 'cooldown' seconds.
+    """
+    def __init__(self, config):
+        self.region_names = list(config['analysis']['regions'])
+        rules = config['alert'].get('rules') or default_rules(config)
+        default_cooldown = config['alert'].get('cooldown', 60)
+        
+        names, metrics, regions = [], [], []
+        sources, on, off, sustain, cooldown, messages = [], [], [], [], [], []
+        for rule in rules:
+            metric = rule.get('metric', 'count')
+            if metric in REGION_METRICS:
+                rule_regions = rule.get('regions', 'all')
+                rule_regions = self.region_names if rule_regions == 'all' else list(rule_regions)
+            elif metric in TOTAL_METRICS:
+                rule_regions = ['total']
+            else:
+                raise ValueError(f"Unknown alert rule metric: {metric}")
+            
+            for region in rule_regions:
+                names.append(rule.get('name', metric))
+                metrics.append(metric)
+                regions.append(region)
+                sources.append(self._metric_index(metric, region))
+                on.append(self._threshold(config, rule.get('threshold'), region))
+                off.append(self._threshold(config, rule.get('release', rule.get('threshold')), region))
+                sustain.append(self._per_region(rule.get('sustain', 0), region, 0))
+                cooldown.append(self._per_region(rule.get('cooldown', default_cooldown), region, default_cooldown))
+                messages.append(rule.get('message', DEFAULT_MESSAGES[metric]))
+        
+        self.names = names
+        self.metrics = metrics
+        self.regions = regions
+        self.messages = messages
+        self.sources = np.array(sources, dtype=np.int64)
+        self.on = np.array(on, dtype=np.float64)
+        self.off = np.minimum(np.array(off, dtype=np.float64), self.on)
+        self.sustain = np.array(sustain, dtype=np.float64)
+        self.cooldown = np.array(cooldown, dtype=np.float64)
+        self.reset()
+    
+    def _metric_index(self, metric, region):
+        """Position of a metric value in the per-frame metric vector"""
+        num_regions = len(self.region_names)
+        if metric in TOTAL_METRICS:
+            return 2 * num_regions + TOTAL_METRICS.index(metric)
+        if region not in self.region_names:
+            raise ValueError(f"Unknown region in alert rule: {region}")
+        return REGION_METRICS.index(metric) * num_regions + self.region_names.index(region)
+    
+    def _per_region(self, value, region, default):
+        """Resolve a setting given as a number or as {region: number, 'default': number}"""
+        if isinstance(value, dict):
+            return value.get(region, value.get('default', default))
+        return value
+    
+    def _threshold(self, config, value, region):
+        """Resolve a threshold, 'max_count' refers to the region's max_count"""
+        value = self._per_region(value, region, None)
+        if value == 'max_count':
+            return config['analysis']['regions'][region]['max_count']
+        if value is None:
+            raise ValueError(f"Alert rule without a threshold for {region}")
+        return value
+    
+    def reset(self):
+        """Clear the state of all rules"""
+        self.active = np.zeros(len(self.on), dtype=bool)
+        self.since = np.full(len(self.on), np.nan)
+        self.last_alert = np.full(len(self.on), -np.inf)
+        self.previous_counts = None
+        self.previous_time = None
+    
+    def metric_values(self, analysis_results, now):
+        """Per-frame metric vector: counts, rates (per second), total_people, total_count"""
+        counts = np.array([analysis_results['counts'].get(region, 0) for region in self.region_names],
+                          dtype=np.float64)
+        rates = np.zeros(len(counts))
+        if self.previous_counts is not None and now > self.previous_time:
+            rates = (counts - self.previous_counts) / (now - self.previous_time)
+        self.previous_counts = counts
+        self.previous_time = now
+        
+        totals = [analysis_results.get('total_people', 0), analysis_results.get('total_count', counts.sum())]
+        return np.concatenate([counts, rates, np.array(totals, dtype=np.float64)])
+    
+    def evaluate(self, analysis_results, now):
+        """
+        Evaluate all rules on one frame
+        
+        Args:
+            analysis_results: Dictionary with analysis results
+            now: Current time in seconds
+        
+        Returns:
+            Dictionary of triggered alerts by '<rule>:<region>'
+        """
+        values = self.metric_values(analysis_results, now)[self.sources]
+        
+        # Hysteresis: on above the threshold, stays on until at or below the release level
+        self.active = np.where(self.active, values > self.off, values > self.on)
+        self.since = np.where(self.active, np.where(np.isnan(self.since), now, self.since), np.nan)
+        
+        fired = self.active & (now - self.since >= self.sustain) & (now - self.last_alert > self.cooldown)
+        self.last_alert[fired] = now
+        
+        alerts = {}
+        timestamp = datetime.now().isoformat()
+        for i in np.flatnonzero(fired).tolist():
+            value = values[i].item()
+            if self.metrics[i] != 'rate':
+                value = int(value)
+            threshold = self.on[i].item()
+            threshold = int(threshold) if threshold.is_integer() else threshold
+            alerts[f"{self.names[i]}:{self.regions[i]}"] = {
+                'timestamp': timestamp,
+                'rule': self.names[i],
+                'region': self.regions[i],
+                'count': value,
+                'max_count': threshold,
+                'message': self.messages[i].format(rule=self.names[i], region=self.regions[i],
+                                                   value=value, threshold=threshold)
+            }
+        return alerts
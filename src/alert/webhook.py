@@ -0,0 +1,121 @@
+import json
+import logging
+import threading
+import http.client
+from collections import deque
+from urllib.parse import urlsplit
+
+class WebhookSink:
+    """
+    Post alerts to an HTTP endpoint in batches
+    
+    Alerts are buffered and sent as one JSON POST ({"alerts": [...]}) per
+    flush interval over a kept-alive connection. A failed POST reconnects
+    and is retried with exponential backoff up to max_retries times, then
+    the batch is dropped and logged. The buffer is bounded (oldest alerts
+    are dropped first).
+    """
+    def __init__(self, config):
+        webhook_config = config['alert'].get('webhook', {})
+        self.url = urlsplit(webhook_config['url'])
+        self.flush_interval = webhook_config.get('flush_interval', 1.0)
+        self.timeout = webhook_config.get('timeout', 5)
+        self.max_retries = webhook_config.get('max_retries', 3)
+        self.backoff = webhook_config.get('backoff', 0.5)
+        self.max_backoff = webhook_config.get('max_backoff', 8)
+        self.headers = {'Content-Type': 'application/json', 'Connection': 'keep-alive'}
+        self.headers.update(webhook_config.get('headers', {}))
+        self.logger = logging.getLogger('AlertManager')
+        
+        self.buffer = deque(maxlen=webhook_config.get('max_buffer', 1000))
+        self.connection = None
+        self.sent = 0
+        self.failed = 0
+        self.closed = threading.Event()
+        # One POST at a time on the shared connection (flush thread, close and late sends)
+        self.flush_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name='WebhookSink', daemon=True)
+        self.thread.start()
+    
+    def send(self, alerts):
+        """Buffer alerts for the next POST (never blocks on the network while the sink is open)"""
+        self.buffer.extend(alerts)
+        if self.closed.is_set():
+            # The flush thread has stopped, deliver right away
+            self.flush()
+    
+    def _connect(self):
+        """Open the connection to the endpoint"""
+        connection_class = http.client.HTTPSConnection if self.url.scheme == 'https' else http.client.HTTPConnection
+        return connection_class(self.url.hostname, self.url.port, timeout=self.timeout)
+    
+    def _post(self, body):
+        """POST one body on the kept-alive connection, reconnecting once on a stale connection"""
+        path = self.url.path or '/'
+        if self.url.query:
+            path += '?' + self.url.query
+        
+        for attempt in range(2):
+            if self.connection is None:
+                self.connection = self._connect()
+            try:
+                self.connection.request('POST', path, body=body, headers=self.headers)
+                response = self.connection.getresponse()
+                response.read()
+                if response.status >= 300:
+                    raise http.client.HTTPException(f"HTTP {response.status}")
+                return
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # The server closed the idle connection, retry on a fresh one
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+            except Exception:
+                self.connection.close()
+                self.connection = None
+                raise
+    
+    def flush(self):
+        """Send the buffered alerts as one POST, with retries"""
+        with self.flush_lock:
+            return self._flush()
+    
+    def _flush(self):
+        """Send the buffered alerts (flush_lock held)"""
+        batch = []
+        while self.buffer:
+            batch.append(self.buffer.popleft())
+        if not batch:
+            return True
+        
+        body = json.dumps({'alerts': batch}, default=str).encode('utf-8')
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._post(body)
+                self.sent += len(batch)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += len(batch)
+                    self.logger.error(f"Webhook delivery of {len(batch)} alerts failed: {e}")
+                    return False
+                # Back off (no waiting once closing)
+                self.closed.wait(delay)
+                delay = min(delay * 2, self.max_backoff)
+        return False
+    
+    def _run(self):
+        """Flush every interval until closed"""
+        while not self.closed.wait(self.flush_interval):
+            self.flush()
+    
+    def close(self):
+        """Send the remaining alerts and close the connection"""
+        self.closed.set()
+        self.thread.join()
+        self.flush()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,87 @@
+import json
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the connection alive between POSTs
+    protocol_version = 'HTTP/1.1'
+    
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        status = self.server.status
+        if status < 300:
+            alerts = json.loads(body or b'{}').get('alerts', [])
+            with self.server.lock:
+                self.server.received.append(alerts)
+            if self.server.verbose:
+                for alert in alerts:
+                    print(f"[{alert.get('source', 'unknown')}] {alert.get('message', '')}")
+        
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class StubReceiver:
+    """
+    Local webhook endpoint that records the alert batches it receives
+    
+    For tests and manual checks of the webhook sink. Each POST body is
+    stored as one batch in received. Set status to simulate failures.
+    """
+    def __init__(self, host='127.0.0.1', port=0, verbose=False):
+        self.server = ThreadingHTTPServer((host, port), _WebhookHandler)
+        self.server.received = []
+        self.server.lock = threading.Lock()
+        self.server.status = 200
+        self.server.verbose = verbose
+        self.thread = None
+    
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/alerts"
+    
+    @property
+    def received(self):
+        with self.server.lock:
+            return list(self.server.received)
+    
+    @property
+    def status(self):
+        return self.server.status
+    
+    @status.setter
+    def status(self, value):
+        self.server.status = value
+    
+    def start(self):
+        """Serve on a background thread"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        """Stop serving"""
+        self.server.shutdown()
+        self.server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Local webhook receiver that prints incoming alerts')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    args = parser.parse_args()
+    
+    receiver = StubReceiver(args.host, args.port, verbose=True)
+    print(f"Receiving alerts on {receiver.url}")
+    try:
+        receiver.server.serve_forever()
+    except KeyboardInterrupt:
+        receiver.server.server_close()
+
+if __name__ == "__main__":
+    main()
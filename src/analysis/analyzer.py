@@ -1,14 +1,91 @@
 import cv2
+import json
+import time
 import numpy as np
 from datetime import datetime
 
+from ..detection.detection_batch import as_detection_batch
+from ..utils.cache import LRUCache
+from .stats import OccupancyStats
+from .lines import LineCounter
+
+# Region outline colors (BGR)
+REGION_COLOR = (0, 255, 0)
+REGION_ANOMALY_COLOR = (0, 0, 255)
+LINE_COLOR = (255, 128, 0)
+
+# Maximum number of cached region overlays (frame size x anomaly state)
+OVERLAY_CACHE_SIZE = 64
+
+# Maximum number of frame sizes with cached region geometry and inference rectangles
+FRAME_SIZE_CACHE_SIZE = 16
+
+# Maximum number of frame sizes with cached label masks (a uint32 mask plus
+# one integral image per region's bounding box, the largest entries)
+MASK_CACHE_SIZE = 4
+
+def rect_area(rect):
+    """Area of an (x1, y1, x2, y2) rectangle"""
+    return max(rect[2] - rect[0], 0) * max(rect[3] - rect[1], 0)
+
+def merge_rects(rects):
+    """
+    Merge overlapping rectangles when their union is no larger than both together
+    
+    Args:
+        rects: List of (x1, y1, x2, y2) rectangles
+        
+    Returns:
+        List of merged rectangles
+    """
+    rects = [rect for rect in rects if rect_area(rect) > 0]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                if a[0] >= b[2] or b[0] >= a[2] or a[1] >= b[3] or b[1] >= a[3]:
+                    continue
+                union = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                if rect_area(union) <= rect_area(a) + rect_area(b):
+                    rects[i] = union
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return rects
+
 class RegionAnalyzer:
     def __init__(self, config):
         self.config = config
         self.regions = config['analysis']['regions']
         self.region_counts = {region: 0 for region in self.regions}
         self.anomalies = {region: False for region in self.regions}
+        self.region_names = list(self.regions)
+        self.membership = np.zeros((0, len(self.region_names)), dtype=bool)
+        self._compiled_cache = LRUCache(FRAME_SIZE_CACHE_SIZE)
+        self._mask_cache = LRUCache(MASK_CACHE_SIZE)
+        self._overlay_cache = LRUCache(OVERLAY_CACHE_SIZE)
+        self.stats = OccupancyStats(config, self.region_names)
+        self.lines = LineCounter(config)
         
+        membership_config = config['analysis'].get('membership', {})
+        self.membership_method = membership_config.get('method', 'polygon')
+        self.anchor = membership_config.get('anchor', 'center')
+        self.overlap_ratio = membership_config.get('overlap_ratio', 0.5)
+        
+        roi_config = config['analysis'].get('roi_inference', {})
+        self.roi_enabled = roi_config.get('enabled', False)
+        self.roi_margin = roi_config.get('margin', 5)
+        self._roi_cache = LRUCache(FRAME_SIZE_CACHE_SIZE)
+        
+    def reset(self):
+        """Reset the per-source state (rolling statistics and line counters) for a new source"""
+        self.stats.reset()
+        self.lines.reset()
+    
     def is_point_in_polygon(self, point, polygon):
         """Check if a point is inside a polygon"""
         x, y = point
@@ -34,18 +111,292 @@ class RegionAnalyzer:
         return [[int(x * frame_width / 100), int(y * frame_height / 100)] 
                 for x, y in percentage_coords]
     
-    def analyze(self, detections, frame=None):
+    def get_inference_rois(self, frame):
+        """
+        Get the pixel rectangles to run ROI-cropped inference on
+        
+        Each region's bounding box is grown by the configured margin (percent
+        of the frame size). Overlapping boxes are merged when one crop is
+        cheaper than two.
+        
+        Args:
+            frame: Frame the rectangles are computed for
+            
+        Returns:
+            List of (x1, y1, x2, y2) rectangles, or None when ROI inference is disabled
+        """
+        if not self.roi_enabled or frame is None:
+            return None
+        
+        frame_height, frame_width = frame.shape[:2]
+        key = (frame_width, frame_height)
+        rects = self._roi_cache.get(key)
+        if rects is None:
+            margin_x = self.roi_margin * frame_width / 100
+            margin_y = self.roi_margin * frame_height / 100
+            
+            rects = []
+            for region_data in self.regions.values():
+                polygon = np.array(self.get_pixel_coordinates(
+                    region_data['coordinates'], frame_width, frame_height))
+                x1, y1 = polygon.min(axis=0)
+                x2, y2 = polygon.max(axis=0)
+                rects.append((max(int(x1 - margin_x), 0), max(int(y1 - margin_y), 0),
+                              min(int(x2 + margin_x), frame_width), min(int(y2 + margin_y), frame_height)))
+            
+            rects = merge_rects(rects)
+            self._roi_cache[key] = rects
+        
+        return rects
+    
+    def get_compiled_regions(self, frame_width, frame_height):
+        """
+        Get the pixel geometry of all regions for a frame size
+        
+        Computed once per frame size and cached. Polygon edges are stored as
+        R x V arrays (V = most vertices of any region). Shorter polygons are
+        padded with horizontal edges, which never count as a crossing.
+        
+        Returns:
+            Dictionary with 'polygons' (list of vertex arrays), 'centroids'
+            (R x 2) and edge arrays 'x1', 'y1', 'y_min', 'y_max', 'slope' (R x V)
+        """
+        key = (frame_width, frame_height)
+        compiled = self._compiled_cache.get(key)
+        if compiled is not None:
+            return compiled
+        
+        polygons = [np.array(self.get_pixel_coordinates(self.regions[name]['coordinates'],
+                                                        frame_width, frame_height), dtype=np.int32)
+                    for name in self.region_names]
+        max_vertices = max((len(polygon) for polygon in polygons), default=1)
+        
+        starts = np.zeros((len(polygons), max_vertices, 2))
+        ends = np.zeros((len(polygons), max_vertices, 2))
+        for i, polygon in enumerate(polygons):
+            starts[i] = polygon[0]
+            ends[i] = polygon[0]
+            starts[i, :len(polygon)] = polygon
+            ends[i, :len(polygon)] = np.roll(polygon, -1, axis=0)
+        
+        x1, y1 = starts[..., 0], starts[..., 1]
+        x2, y2 = ends[..., 0], ends[..., 1]
+        dy = y2 - y1
+        slope = np.divide(x2 - x1, dy, out=np.zeros_like(dy), where=dy != 0)
+        
+        compiled = {
+            'polygons': polygons,
+            'centroids': np.array([polygon.mean(axis=0) for polygon in polygons], dtype=np.int32).reshape(-1, 2),
+            'x1': x1,
+            'y1': y1,
+            'y_min': np.minimum(y1, y2),
+            'y_max': np.maximum(y1, y2),
+            'slope': slope
+        }
+        self._compiled_cache[key] = compiled
+        return compiled
+    
+    def region_membership(self, points, frame_width, frame_height):
+        """
+        Test all points against all regions in one vectorized ray-casting pass
+        
+        Args:
+            points: N x 2 array of pixel coordinates
+            frame_width: Width of the frame the points belong to
+            frame_height: Height of the frame the points belong to
+            
+        Returns:
+            N x R boolean membership matrix (columns in self.region_names order)
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        compiled = self.get_compiled_regions(frame_width, frame_height)
+        
+        x = points[:, 0, None, None]
+        y = points[:, 1, None, None]
+        crossings = (y > compiled['y_min']) & (y <= compiled['y_max'])
+        crossings &= x <= (y - compiled['y1']) * compiled['slope'] + compiled['x1']
+        
+        return (np.count_nonzero(crossings, axis=2) % 2).astype(bool)
+    
+    def get_region_masks(self, frame_width, frame_height, with_integrals=False):
+        """
+        Get the rasterized label mask of all regions for a frame size
+        
+        Bit i of each uint32 pixel is set when the pixel lies in region i, so
+        overlapping regions are supported (up to 32 regions). Masks are cached
+        per (frame size, region config hash).
+        
+        Args:
+            frame_width: Width of the frame
+            frame_height: Height of the frame
+            with_integrals: Also build per-region integral images for box overlap,
+                each covering only the region's bounding box
+            
+        Returns:
+            Dictionary with 'mask' (H x W uint32) and, if requested,
+            'integrals' (list of (x, y, integral) per region: bounding box
+            origin and its (h + 1) x (w + 1) int32 integral image)
+        """
+        if len(self.region_names) > 32:
+            raise ValueError("Region masks support at most 32 regions")
+        
+        key = (frame_width, frame_height,
+               hash(json.dumps(self.regions, sort_keys=True, default=str)))
+        masks = self._mask_cache.get(key)
+        if masks is None:
+            compiled = self.get_compiled_regions(frame_width, frame_height)
+            mask = np.zeros((frame_height, frame_width), dtype=np.uint32)
+            region_mask = np.zeros((frame_height, frame_width), dtype=np.uint8)
+            for bit, polygon in enumerate(compiled['polygons']):
+                region_mask[:] = 0
+                cv2.fillPoly(region_mask, [polygon.reshape((-1, 1, 2))], 1)
+                mask[region_mask > 0] |= np.uint32(1 << bit)
+            masks = {'mask': mask}
+            self._mask_cache[key] = masks
+        
+        if with_integrals and 'integrals' not in masks:
+            # Outside its bounding box a region contributes nothing, so the integral stops there
+            integrals = []
+            frame_size = [frame_width, frame_height]
+            for bit, polygon in enumerate(self.get_compiled_regions(frame_width, frame_height)['polygons']):
+                x1, y1 = polygon.min(axis=0).clip(0, frame_size)
+                x2, y2 = (polygon.max(axis=0) + 1).clip(0, frame_size)
+                region_mask = (masks['mask'][y1:y2, x1:x2] >> np.uint32(bit)) & 1
+                integral = region_mask.cumsum(axis=0, dtype=np.int32).cumsum(axis=1, dtype=np.int32)
+                integrals.append((int(x1), int(y1), np.pad(integral, ((1, 0), (1, 0)))))
+            masks['integrals'] = integrals
+        
+        return masks
+    
+    def anchor_points(self, detections):
+        """Points used for membership: box centers or bottom centers (the footprint)"""
+        if self.anchor == 'bottom_center':
+            return np.column_stack([detections.centers[:, 0], detections.xyxy[:, 3] - 1])
+        return detections.centers
+    
+    def mask_membership(self, detections, frame_width, frame_height):
+        """
+        Region membership looked up in the precomputed label mask
+        
+        With anchor 'overlap' a detection belongs to a region when at least
+        overlap_ratio of its box area lies inside the region, computed in O(1)
+        per box and region from integral images. Otherwise the anchor point's
+        mask pixel is read.
+        
+        Returns:
+            N x R boolean membership matrix (columns in self.region_names order)
+        """
+        bits = np.arange(len(self.region_names), dtype=np.uint32)
+        
+        if self.anchor == 'overlap':
+            integrals = self.get_region_masks(frame_width, frame_height, with_integrals=True)['integrals']
+            x1 = detections.xyxy[:, 0].clip(0, frame_width)
+            y1 = detections.xyxy[:, 1].clip(0, frame_height)
+            x2 = detections.xyxy[:, 2].clip(0, frame_width)
+            y2 = detections.xyxy[:, 3].clip(0, frame_height)
+            
+            # Boxes clipped to each region's bounding box, in its integral image coordinates
+            inside = np.zeros((len(x1), len(integrals)), dtype=np.int64)
+            for i, (x, y, integral) in enumerate(integrals):
+                width, height = integral.shape[1] - 1, integral.shape[0] - 1
+                bx1, bx2 = (x1 - x).clip(0, width), (x2 - x).clip(0, width)
+                by1, by2 = (y1 - y).clip(0, height), (y2 - y).clip(0, height)
+                inside[:, i] = (integral[by2, bx2] - integral[by1, bx2]
+                                - integral[by2, bx1] + integral[by1, bx1])
+            area = np.maximum((x2 - x1) * (y2 - y1), 1)
+            return inside >= self.overlap_ratio * area[:, None]
+        
+        mask = self.get_region_masks(frame_width, frame_height)['mask']
+        points = self.anchor_points(detections)
+        x = points[:, 0].clip(0, frame_width - 1)
+        y = points[:, 1].clip(0, frame_height - 1)
+        return ((mask[y, x][:, None] >> bits) & 1).astype(bool)
+    
+    def count_regions(self, detections, frame_width, frame_height):
+        """
+        Count detections inside each region
+        
+        Membership uses the configured method (polygon ray casting or label
+        mask) and anchor (center, bottom_center or box overlap). The detection
+        x region membership matrix is kept in self.membership.
+        
+        Args:
+            detections: DetectionBatch (or list of detection dictionaries)
+            frame_width: Width of the frame the detections belong to
+            frame_height: Height of the frame the detections belong to
+            
+        Returns:
+            Dictionary mapping region names to counts
+        """
+        detections = as_detection_batch(detections)
+        if self.membership_method == 'mask' or self.anchor == 'overlap':
+            self.membership = self.mask_membership(detections, frame_width, frame_height)
+        else:
+            self.membership = self.region_membership(self.anchor_points(detections), frame_width, frame_height)
+        counts = np.count_nonzero(self.membership, axis=0).tolist()
+        
+        return dict(zip(self.region_names, counts))
+    
+    def get_region_overlay(self, frame_width, frame_height):
+        """
+        Get the pre-rendered region outlines (and counting lines) for a frame size and the current anomaly state
+        
+        Outlines are drawn once onto a blank layer with an alpha mask. Only the
+        drawn pixels are kept, as flat pixel indices with their colors and
+        alpha, so compositing is a single vectorized blend.
+        
+        Returns:
+            Dictionary with 'indices' (K), 'colors' (K x 3 uint16) and 'alpha' (K x 1 uint16)
+        """
+        state = tuple(self.anomalies[name] for name in self.region_names)
+        key = (frame_width, frame_height, state)
+        overlay = self._overlay_cache.get(key)
+        if overlay is not None:
+            return overlay
+        
+        compiled = self.get_compiled_regions(frame_width, frame_height)
+        layer = np.zeros((frame_height, frame_width, 3), dtype=np.uint8)
+        alpha = np.zeros((frame_height, frame_width), dtype=np.uint8)
+        for pixel_polygon, is_anomaly in zip(compiled['polygons'], state):
+            polygon = pixel_polygon.reshape((-1, 1, 2))
+            color = REGION_ANOMALY_COLOR if is_anomaly else REGION_COLOR
+            cv2.polylines(layer, [polygon], True, color, 2)
+            cv2.polylines(alpha, [polygon], True, 255, 2)
+        
+        if self.lines.enabled:
+            for polyline in self.lines.get_compiled_lines(frame_width, frame_height)['polylines']:
+                cv2.polylines(layer, [polyline.reshape((-1, 1, 2))], False, LINE_COLOR, 2)
+                cv2.polylines(alpha, [polyline.reshape((-1, 1, 2))], False, 255, 2)
+        
+        indices = np.flatnonzero(alpha)
+        overlay = {
+            'indices': indices,
+            'colors': layer.reshape(-1, 3)[indices].astype(np.uint16),
+            'alpha': alpha.reshape(-1)[indices, None].astype(np.uint16)
+        }
+        
+        # Anomaly states can multiply, the cache keeps the most recently used
+        self._overlay_cache[key] = overlay
+        return overlay
+    
+    def analyze(self, detections, frame=None, timestamp=None, update_stats=True):
         """
         Analyze detections to count objects in defined regions
         
         Args:
-            detections: List of detection dictionaries
+            detections: DetectionBatch (or list of detection dictionaries)
             frame: Optional frame to draw regions on
+            timestamp: Time of the frame in seconds for the rolling statistics
+                (defaults to the current time; pass the video time for files)
+            update_stats: Add this frame to the rolling statistics. Pass False
+                for repeated results (e.g. detections reused on skipped frames)
             
         Returns:
             analysis_results: Dictionary with analysis results
             annotated_frame: Frame with regions and counts drawn
         """
+        detections = as_detection_batch(detections)
+        
         # Reset counts
         self.region_counts = {region: 0 for region in self.regions}
         
@@ -55,15 +406,7 @@ class RegionAnalyzer:
             frame_height, frame_width = frame.shape[:2]
         
         # Count objects in each region
-        for detection in detections:
-            center = detection['center']
-            for region_name, region_data in self.regions.items():
-                # Convert percentage coordinates to pixel coordinates
-                pixel_polygon = self.get_pixel_coordinates(
-                    region_data['coordinates'], frame_width, frame_height)
-                
-                if self.is_point_in_polygon(center, pixel_polygon):
-                    self.region_counts[region_name] += 1
+        self.region_counts = self.count_regions(detections, frame_width, frame_height)
         
         # Check for anomalies
         for region_name, count in self.region_counts.items():
@@ -76,32 +419,53 @@ class RegionAnalyzer:
             'counts': self.region_counts.copy(),
             'anomalies': self.anomalies.copy(),
             'total_count': sum(self.region_counts.values()),
-            'total_people': sum(1 for d in detections if d['class_name'] == 'person')
+            'total_people': detections.count('person')
         }
         
+        # Update the rolling occupancy statistics
+        if self.stats.enabled:
+            if update_stats:
+                self.stats.update(self.region_counts, time.time() if timestamp is None else timestamp)
+            analysis_results['stats'] = self.stats.summary()
+        
+        # Update the line crossing counters (needs tracked detections)
+        if self.lines.enabled:
+            self.lines.update(detections, frame_width, frame_height)
+            analysis_results['lines'] = self.lines.summary()
+        
         # Draw regions on frame if provided
         annotated_frame = None
         if frame is not None:
             annotated_frame = frame.copy()
-            for region_name, region_data in self.regions.items():
-                # Convert percentage coordinates to pixel coordinates
-                pixel_polygon = self.get_pixel_coordinates(
-                    region_data['coordinates'], frame_width, frame_height)
-                
-                polygon = np.array(pixel_polygon, np.int32)
-                polygon = polygon.reshape((-1, 1, 2))
-                
-                # Choose color based on anomaly status
-                color = (0, 0, 255) if self.anomalies[region_name] else (0, 255, 0)
-                
-                cv2.polylines(annotated_frame, [polygon], True, color, 2)
-                
-                # Add count text
-                centroid = np.mean(pixel_polygon, axis=0).astype(int)
+            compiled = self.get_compiled_regions(frame_width, frame_height)
+            
+            # Composite the cached region outlines in one pass
+            if annotated_frame.ndim == 3 and annotated_frame.shape[2] == 3:
+                overlay = self.get_region_overlay(frame_width, frame_height)
+                pixels = annotated_frame.reshape(-1, 3)
+                indices = overlay['indices']
+                background = pixels[indices].astype(np.uint16)
+                pixels[indices] = ((overlay['colors'] * overlay['alpha']
+                                    + background * (255 - overlay['alpha'])) // 255).astype(np.uint8)
+            else:
+                for region_name, pixel_polygon in zip(self.region_names, compiled['polygons']):
+                    color = REGION_ANOMALY_COLOR if self.anomalies[region_name] else REGION_COLOR
+                    cv2.polylines(annotated_frame, [pixel_polygon.reshape((-1, 1, 2))], True, color, 2)
+            
+            # Only the count text changes every frame
+            for region_name, centroid in zip(self.region_names, compiled['centroids'].tolist()):
+                color = REGION_ANOMALY_COLOR if self.anomalies[region_name] else REGION_COLOR
                 text = f"{region_name}: {self.region_counts[region_name]}"
                 cv2.putText(annotated_frame, text, tuple(centroid), 
                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
             
+            if self.lines.enabled:
+                polylines = self.lines.get_compiled_lines(frame_width, frame_height)['polylines']
+                for (line_name, counts), polyline in zip(analysis_results['lines'].items(), polylines):
+                    text = f"{line_name}: in {counts['in']} / out {counts['out']}"
+                    cv2.putText(annotated_frame, text, tuple(polyline[0].tolist()),
+                               cv2.FONT_HERSHEY_SIMPLEX, 0.6, LINE_COLOR, 2)
+            
             # Add total count
             total_text = f"Total People: {analysis_results['total_people']}"
             cv2.putText(annotated_frame, total_text, (10, 30), 
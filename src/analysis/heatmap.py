@@ -0,0 +1,156 @@
+import os
+import time
+import cv2
+import numpy as np
+from datetime import datetime
+
+from ..detection.detection_batch import as_detection_batch
+
+# Decay exponent at which the accumulated weights are renormalized
+RENORMALIZE_EXPONENT = 32
+
+class HeatmapAccumulator:
+    """
+    Incremental density heatmap of one source
+    
+    Detection anchors (box center, bottom center, or the whole box footprint)
+    are binned into a fixed low-resolution grid. Older observations decay
+    with the configured half-life. The decay is applied lazily by growing the
+    weight of new samples, so an update only touches the new detections.
+    Snapshots are saved periodically as compressed .npz arrays.
+    """
+    def __init__(self, config, source="unknown"):
+        heatmap_config = config['analysis'].get('heatmap', {})
+        self.enabled = heatmap_config.get('enabled', False)
+        self.grid_width, self.grid_height = heatmap_config.get('grid', [64, 36])
+        self.anchor = heatmap_config.get('anchor', 'bottom_center')
+        self.half_life = heatmap_config.get('half_life', 600)
+        self.snapshot_interval = heatmap_config.get('snapshot_interval', 300)
+        self.output_dir = heatmap_config.get('output_dir', 'output/heatmaps')
+        self.source = source
+        self.reset()
+    
+    def reset(self):
+        """Clear the heatmap"""
+        self.grid = np.zeros((self.grid_height, self.grid_width), dtype=np.float64)
+        self.reference_time = None
+        self.last_timestamp = None
+        self.last_snapshot = None
+    
+    def _weight(self, timestamp):
+        """Weight of a sample at a time, relative to the reference time"""
+        if self.half_life <= 0:
+            return 1.0
+        
+        exponent = (timestamp - self.reference_time) / self.half_life
+        if exponent > RENORMALIZE_EXPONENT:
+            # Fold the decay into the grid to keep the weights small
+            self.grid *= 2.0 ** -exponent
+            self.reference_time = timestamp
+            exponent = 0
+        return 2.0 ** exponent
+    
+    def update(self, detections, frame_width, frame_height, timestamp=None):
+        """
+        Add the detections of one frame
+        
+        Args:
+            detections: DetectionBatch (or list of detection dictionaries)
+            frame_width: Width of the frame the detections belong to
+            frame_height: Height of the frame the detections belong to
+            timestamp: Time of the frame in seconds (defaults to the current time)
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        if self.reference_time is None:
+            self.reference_time = timestamp
+            self.last_snapshot = timestamp
+        self.last_timestamp = timestamp
+        
+        detections = as_detection_batch(detections)
+        if len(detections):
+            weight = self._weight(timestamp)
+            scale_x = self.grid_width / frame_width
+            scale_y = self.grid_height / frame_height
+            
+            if self.anchor == 'footprint':
+                self._add_boxes(detections.xyxy, scale_x, scale_y, weight)
+            else:
+                if self.anchor == 'bottom_center':
+                    points = np.column_stack([detections.centers[:, 0], detections.xyxy[:, 3] - 1])
+                else:
+                    points = detections.centers
+                cells_x = (points[:, 0] * scale_x).astype(np.int64).clip(0, self.grid_width - 1)
+                cells_y = (points[:, 1] * scale_y).astype(np.int64).clip(0, self.grid_height - 1)
+                cells = np.bincount(cells_y * self.grid_width + cells_x, minlength=self.grid.size)
+                self.grid += weight * cells.reshape(self.grid.shape)
+        
+        if self.snapshot_interval and timestamp - self.last_snapshot >= self.snapshot_interval:
+            self.save_snapshot()
+            self.last_snapshot = timestamp
+    
+    def _add_boxes(self, xyxy, scale_x, scale_y, weight):
+        """Spread each box uniformly over the grid cells it covers (one unit per box)"""
+        x1 = (xyxy[:, 0] * scale_x).astype(np.int64).clip(0, self.grid_width - 1)
+        y1 = (xyxy[:, 1] * scale_y).astype(np.int64).clip(0, self.grid_height - 1)
+        x2 = (np.ceil(xyxy[:, 2] * scale_x).astype(np.int64)).clip(x1 + 1, self.grid_width)
+        y2 = (np.ceil(xyxy[:, 3] * scale_y).astype(np.int64)).clip(y1 + 1, self.grid_height)
+        values = weight / ((x2 - x1) * (y2 - y1))
+        
+        # 2D difference array: four corner updates per box, then prefix sums
+        diff = np.zeros((self.grid_height + 1, self.grid_width + 1))
+        np.add.at(diff, (y1, x1), values)
+        np.add.at(diff, (y1, x2), -values)
+        np.add.at(diff, (y2, x1), -values)
+        np.add.at(diff, (y2, x2), values)
+        self.grid += diff.cumsum(axis=0).cumsum(axis=1)[:-1, :-1]
+    
+    def snapshot(self):
+        """Current heatmap with the decay applied, as float32"""
+        if self.reference_time is None:
+            return np.zeros_like(self.grid, dtype=np.float32)
+        if self.half_life <= 0:
+            return self.grid.astype(np.float32)
+        decay = 2.0 ** -((self.last_timestamp - self.reference_time) / self.half_life)
+        return (self.grid * decay).astype(np.float32)
+    
+    def save_snapshot(self):
+        """
+        Save the current heatmap as a compressed .npz file
+        
+        Returns:
+            Path of the saved file
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        source = "".join(c if c.isalnum() or c in '-_.' else '_' for c in str(self.source))
+        path = os.path.join(self.output_dir, f"{source}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.npz")
+        np.savez_compressed(path, heatmap=self.snapshot(), source=str(self.source),
+                            timestamp=self.last_timestamp, half_life=self.half_life)
+        return path
+    
+    def render(self, frame, alpha=0.4):
+        """
+        Blend the heatmap onto a copy of a frame
+        
+        Args:
+            frame: Image as numpy array (BGR format)
+            alpha: Opacity of the heatmap where it is hottest
+            
+        Returns:
+            Frame with the heatmap overlay
+        """
+        heatmap = self.snapshot()
+        peak = heatmap.max()
+        if peak <= 0:
+            return frame.copy()
+        
+        frame_height, frame_width = frame.shape[:2]
+        intensity = cv2.resize(heatmap / peak, (frame_width, frame_height), interpolation=cv2.INTER_LINEAR)
+        colors = cv2.applyColorMap((intensity * 255).astype(np.uint8), cv2.COLORMAP_JET)
+        
+        weight = (alpha * intensity)[..., None]
+        return (frame * (1 - weight) + colors * weight).astype(np.uint8)
+
+def load_heatmap(path):
+    """Load a saved heatmap snapshot as a dictionary of arrays"""
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
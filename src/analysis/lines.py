@@ -0,0 +1,204 @@
+import numpy as np
+
+from ..detection.detection_batch import as_detection_batch
+from ..utils.cache import LRUCache
+
+# Maximum number of frame sizes with cached line geometry
+COMPILED_CACHE_SIZE = 16
+
+def cross(u, v):
+    """2D cross product of stacked vectors (... x 2)"""
+    return u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+
+def ragged_ranges(starts, lengths):
+    """
+    Concatenated ranges starts[i] ... starts[i] + lengths[i] - 1
+    
+    Returns:
+        (index of the range each value belongs to, values)
+    """
+    owner = np.repeat(np.arange(len(lengths)), lengths)
+    first = np.cumsum(lengths) - lengths
+    return owner, starts[owner] + np.arange(len(owner)) - first[owner]
+
+class LineCounter:
+    """
+    In/out counters for counting lines, evaluated incrementally on tracks
+    
+    Each track's anchor point is remembered between frames. The movement
+    from the previous to the current point is tested against the line
+    segments, but only against the segments registered in the grid cells
+    the movement spans. Walking along a line from its first point to its
+    last, a crossing from right to left counts as in (swap with invert).
+    """
+    def __init__(self, config):
+        counting_config = config['analysis'].get('counting', {})
+        self.lines = counting_config.get('lines', {}) or {}
+        self.line_names = list(self.lines)
+        self.enabled = counting_config.get('enabled', True) and bool(self.lines)
+        self.anchor = counting_config.get('anchor', 'bottom_center')
+        self.grid_width, self.grid_height = counting_config.get('grid', [16, 16])
+        self.max_missed = counting_config.get('max_missed', 30)
+        self.snapshot_interval = counting_config.get('snapshot_interval', 60)
+        self._compiled_cache = LRUCache(COMPILED_CACHE_SIZE)
+        self.reset()
+    
+    def reset(self):
+        """Forget all tracks and zero the counters"""
+        self.track_ids = np.zeros(0, dtype=np.int64)
+        self.points = np.zeros((0, 2))
+        self.missed = np.zeros(0, dtype=np.int32)
+        self.counts_in = np.zeros(len(self.line_names), dtype=np.int64)
+        self.counts_out = np.zeros(len(self.line_names), dtype=np.int64)
+    
+    def get_compiled_lines(self, frame_width, frame_height):
+        """
+        Get the pixel geometry and spatial grid of all lines for a frame size
+        
+        Segments are registered in every grid cell they pass through. The
+        registration is stored as compressed rows: the segments of cell c
+        (c = y * grid_width + x) are cell_segments[cell_offsets[c]:cell_offsets[c + 1]].
+        
+        Returns:
+            Dictionary with 'polylines' (list of int32 vertex arrays), segment
+            arrays 'starts', 'ends' (S x 2), 'line_index', 'sign' (S), the
+            'cell_size', 'cell_offsets' (cells + 1) and 'cell_segments'
+        """
+        key = (frame_width, frame_height)
+        compiled = self._compiled_cache.get(key)
+        if compiled is not None:
+            return compiled
+        
+        scale = np.array([frame_width / 100, frame_height / 100])
+        polylines = [np.asarray(self.lines[name]['points'], dtype=np.float64) * scale for name in self.line_names]
+        starts = np.concatenate([polyline[:-1] for polyline in polylines]).reshape(-1, 2)
+        ends = np.concatenate([polyline[1:] for polyline in polylines]).reshape(-1, 2)
+        line_index = np.concatenate([np.full(len(polyline) - 1, i) for i, polyline in enumerate(polylines)]).astype(np.int64)
+        sign = np.array([-1 if self.lines[name].get('invert', False) else 1 for name in self.line_names])[line_index]
+        
+        # A segment passes through a cell when their bounding boxes overlap
+        # and the cell corners are not all on one side of the segment
+        cell_size = np.array([frame_width / self.grid_width, frame_height / self.grid_height])
+        cell_x, cell_y = np.meshgrid(np.arange(self.grid_width), np.arange(self.grid_height))
+        cell_min = np.stack([cell_x, cell_y], axis=-1)[..., None, :] * cell_size
+        cell_max = cell_min + cell_size
+        
+        overlaps = ((cell_min <= np.maximum(starts, ends)) & (cell_max >= np.minimum(starts, ends))).all(axis=-1)
+        corners = [cell_min, cell_max, np.concatenate([cell_min[..., :1], cell_max[..., 1:]], axis=-1),
+                   np.concatenate([cell_max[..., :1], cell_min[..., 1:]], axis=-1)]
+        sides = np.stack([np.sign(cross(ends - starts, corner - starts)) for corner in corners])
+        registered = overlaps & (sides.min(axis=0) <= 0) & (sides.max(axis=0) >= 0)
+        
+        cells, cell_segments = np.nonzero(registered.reshape(-1, len(starts)))
+        cell_offsets = np.zeros(self.grid_width * self.grid_height + 1, dtype=np.int64)
+        cell_offsets[1:] = np.bincount(cells, minlength=self.grid_width * self.grid_height).cumsum()
+        
+        compiled = {
+            'polylines': [polyline.astype(np.int32) for polyline in polylines],
+            'starts': starts,
+            'ends': ends,
+            'line_index': line_index,
+            'sign': sign,
+            'cell_size': cell_size,
+            'cell_offsets': cell_offsets,
+            'cell_segments': cell_segments
+        }
+        self._compiled_cache[key] = compiled
+        return compiled
+    
+    def anchor_points(self, detections):
+        """Point of each detection that is followed across the lines"""
+        if self.anchor == 'bottom_center':
+            return np.column_stack([detections.centers[:, 0], detections.xyxy[:, 3]]).astype(np.float64)
+        return detections.centers.astype(np.float64)
+    
+    def count_crossings(self, previous, current, frame_width, frame_height):
+        """
+        Count the line crossings of a set of movements
+        
+        Args:
+            previous: N x 2 array of start points
+            current: N x 2 array of end points
+        
+        Returns:
+            Per-line arrays of in and out crossings
+        """
+        compiled = self.get_compiled_lines(frame_width, frame_height)
+        crossings_in = np.zeros(len(self.line_names), dtype=np.int64)
+        crossings_out = np.zeros(len(self.line_names), dtype=np.int64)
+        if not len(previous):
+            return crossings_in, crossings_out
+        
+        # Cells spanned by each movement's bounding box
+        grid_max = np.array([self.grid_width - 1, self.grid_height - 1])
+        low = (np.minimum(previous, current) // compiled['cell_size']).astype(np.int64).clip(0, grid_max)
+        size = (np.maximum(previous, current) // compiled['cell_size']).astype(np.int64).clip(0, grid_max) + 1 - low
+        cell_movement, k = ragged_ranges(np.zeros(len(low), dtype=np.int64), size[:, 0] * size[:, 1])
+        cell_x = low[cell_movement, 0] + k % size[cell_movement, 0]
+        cell_y = low[cell_movement, 1] + k // size[cell_movement, 0]
+        cells = cell_y * self.grid_width + cell_x
+        
+        # Candidate segments: only those registered in the spanned cells, each pair once
+        offsets = compiled['cell_offsets']
+        owner, position = ragged_ranges(offsets[cells], offsets[cells + 1] - offsets[cells])
+        pairs = np.unique(cell_movement[owner] * len(compiled['starts']) + compiled['cell_segments'][position])
+        if not len(pairs):
+            return crossings_in, crossings_out
+        movement_index, segment_index = np.divmod(pairs, len(compiled['starts']))
+        
+        # Exact segment intersection for the candidate pairs only
+        p, q = previous[movement_index], current[movement_index]
+        a, b = compiled['starts'][segment_index], compiled['ends'][segment_index]
+        side_p = cross(b - a, p - a) > 0
+        side_q = cross(b - a, q - a) > 0
+        side_a = cross(q - p, a - p) > 0
+        side_b = cross(q - p, b - p) > 0
+        crossed = (side_p != side_q) & (side_a != side_b)
+        
+        # Net direction per movement and line, so a polyline crossed back counts once
+        direction = np.where(side_p, 1, -1) * compiled['sign'][segment_index] * crossed
+        net = np.zeros((len(previous), len(self.line_names)), dtype=np.int64)
+        np.add.at(net, (movement_index, compiled['line_index'][segment_index]), direction)
+        return (net > 0).sum(axis=0), (net < 0).sum(axis=0)
+    
+    def update(self, detections, frame_width, frame_height):
+        """
+        Advance the tracks by one frame and update the counters
+        
+        Args:
+            detections: DetectionBatch with track ids (detections without
+                track ids cannot be followed and are ignored)
+            frame_width: Width of the frame the detections belong to
+            frame_height: Height of the frame the detections belong to
+        """
+        detections = as_detection_batch(detections)
+        if detections.track_id is None:
+            return
+        
+        track_ids = detections.track_id.astype(np.int64)
+        points = self.anchor_points(detections)
+        
+        # Movements of the tracks seen in the previous frames
+        order = np.argsort(self.track_ids)
+        positions = np.searchsorted(self.track_ids, track_ids, sorter=order).clip(0, max(len(order) - 1, 0))
+        known = np.zeros(len(track_ids), dtype=bool)
+        if len(order):
+            positions = order[positions]
+            known = self.track_ids[positions] == track_ids
+        
+        crossings_in, crossings_out = self.count_crossings(
+            self.points[positions[known]], points[known], frame_width, frame_height)
+        self.counts_in += crossings_in
+        self.counts_out += crossings_out
+        
+        # Remember the current points, keep unseen tracks for a while
+        unseen = ~np.isin(self.track_ids, track_ids)
+        unseen &= self.missed < self.max_missed
+        self.track_ids = np.concatenate([track_ids, self.track_ids[unseen]])
+        self.points = np.concatenate([points, self.points[unseen]])
+        self.missed = np.concatenate([np.zeros(len(track_ids), dtype=np.int32), self.missed[unseen] + 1])
+    
+    def summary(self):
+        """Cumulative counts as {line: {'in': n, 'out': n}}"""
+        return {name: {'in': int(count_in), 'out': int(count_out)}
+                for name, count_in, count_out in zip(self.line_names, self.counts_in, self.counts_out)}
@@ -0,0 +1,143 @@
+import math
+import numpy as np
+
+class SlidingWindow:
+    """
+    Region counts over the last `horizon` seconds
+    
+    Samples live in a ring buffer (grown when full) shared by all regions.
+    A per-region histogram of the counts in the window gives min, max and
+    percentiles without sorting. Each push and eviction is O(1) per region.
+    """
+    def __init__(self, horizon, num_regions, capacity=1024, max_value=64):
+        self.horizon = horizon
+        self.times = np.zeros(capacity)
+        self.values = np.zeros((capacity, num_regions), dtype=np.int64)
+        self.histogram = np.zeros((num_regions, max_value + 1), dtype=np.int64)
+        self.sums = np.zeros(num_regions, dtype=np.int64)
+        self.rows = np.arange(num_regions)
+        self.start = 0
+        self.size = 0
+    
+    def _grow(self):
+        """Double the ring buffer capacity keeping the samples in order"""
+        order = (self.start + np.arange(self.size)) % len(self.times)
+        capacity = len(self.times) * 2
+        times = np.zeros(capacity)
+        values = np.zeros((capacity, self.values.shape[1]), dtype=np.int64)
+        times[:self.size] = self.times[order]
+        values[:self.size] = self.values[order]
+        self.times, self.values, self.start = times, values, 0
+    
+    def push(self, timestamp, counts):
+        """Add a sample and evict the ones older than the horizon"""
+        max_value = int(counts.max(initial=0))
+        if max_value >= self.histogram.shape[1]:
+            extra = max(max_value + 1, self.histogram.shape[1] * 2) - self.histogram.shape[1]
+            self.histogram = np.pad(self.histogram, ((0, 0), (0, extra)))
+        
+        if self.size == len(self.times):
+            self._grow()
+        
+        index = (self.start + self.size) % len(self.times)
+        self.times[index] = timestamp
+        self.values[index] = counts
+        self.size += 1
+        self.histogram[self.rows, counts] += 1
+        self.sums += counts
+        
+        while self.size and self.times[self.start] < timestamp - self.horizon:
+            expired = self.values[self.start]
+            self.histogram[self.rows, expired] -= 1
+            self.sums -= expired
+            self.start = (self.start + 1) % len(self.times)
+            self.size -= 1
+    
+    def summary(self, percentiles):
+        """
+        Statistics of the samples in the window
+        
+        Returns:
+            Dictionary of per-region arrays: mean, min, max and p<N> for each percentile
+        """
+        present = self.histogram > 0
+        last = self.histogram.shape[1] - 1
+        summary = {
+            'samples': self.size,
+            'mean': self.sums / max(self.size, 1),
+            'min': present.argmax(axis=1),
+            'max': np.where(present.any(axis=1), last - present[:, ::-1].argmax(axis=1), 0)
+        }
+        
+        cumulative = np.cumsum(self.histogram, axis=1)
+        for percentile in percentiles:
+            # Nearest-rank percentile from the cumulative histogram
+            rank = np.maximum(np.ceil(percentile / 100 * self.size), 1)
+            summary[f'p{percentile}'] = (cumulative < rank).sum(axis=1)
+        
+        return summary
+
+class OccupancyStats:
+    """
+    Streaming per-region occupancy statistics
+    
+    Keeps an EWMA of each region's count and, for each configured horizon,
+    a sliding window with mean, min, max and percentiles. Updates are O(1)
+    per frame and region.
+    """
+    def __init__(self, config, region_names):
+        stats_config = config['analysis'].get('stats', {})
+        self.enabled = stats_config.get('enabled', True)
+        self.horizons = stats_config.get('horizons', [60, 300, 900])
+        self.half_life = stats_config.get('ewma_half_life', 30)
+        self.percentiles = stats_config.get('percentiles', [50, 95])
+        self.region_names = list(region_names)
+        self.reset()
+    
+    def reset(self):
+        """Drop all samples"""
+        self.windows = [SlidingWindow(horizon, len(self.region_names)) for horizon in self.horizons]
+        self.ewma = np.zeros(len(self.region_names))
+        self.last_timestamp = None
+    
+    def update(self, counts, timestamp):
+        """
+        Add the region counts of one frame
+        
+        Args:
+            counts: Dictionary mapping region names to counts
+            timestamp: Time of the frame in seconds
+        """
+        values = np.array([counts[name] for name in self.region_names], dtype=np.int64)
+        
+        if self.last_timestamp is None:
+            self.ewma = values.astype(np.float64)
+        else:
+            elapsed = max(timestamp - self.last_timestamp, 0)
+            weight = 1 - math.exp(-elapsed * math.log(2) / self.half_life) if self.half_life > 0 else 1
+            self.ewma += weight * (values - self.ewma)
+        self.last_timestamp = timestamp
+        
+        for window in self.windows:
+            window.push(timestamp, values)
+    
+    def summary(self):
+        """
+        Current statistics per region
+        
+        Returns:
+            Dictionary mapping region names to {'ewma': value, '<horizon>s': {...}}
+        """
+        summaries = [window.summary(self.percentiles) for window in self.windows]
+        
+        stats = {}
+        for i, name in enumerate(self.region_names):
+            region_stats = {'ewma': round(float(self.ewma[i]), 3)}
+            for horizon, summary in zip(self.horizons, summaries):
+                region_stats[f'{horizon}s'] = {
+                    key: (value if key == 'samples' else
+                          round(float(value[i]), 3) if key == 'mean' else int(value[i]))
+                    for key, value in summary.items()
+                }
+            stats[name] = region_stats
+        return stats
@@ -0,0 +1,224 @@
+import numpy as np
+
+from ..detection.detection_batch import DetectionBatch, as_detection_batch
+
+# Noise of the Kalman filter relative to the box height (as in DeepSORT)
+STD_WEIGHT_POSITION = 1 / 20
+STD_WEIGHT_VELOCITY = 1 / 160
+
+def box_iou(boxes_a, boxes_b):
+    """
+    IoU matrix between two sets of boxes
+    
+    Args:
+        boxes_a: N x 4 array of (x1, y1, x2, y2)
+        boxes_b: M x 4 array of (x1, y1, x2, y2)
+        
+    Returns:
+        N x M array of IoU values
+    """
+    a = np.asarray(boxes_a, dtype=np.float32)[:, None, :]
+    b = np.asarray(boxes_b, dtype=np.float32)[None, :, :]
+    
+    inter_w = (np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0])).clip(0)
+    inter_h = (np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1])).clip(0)
+    inter = inter_w * inter_h
+    
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+def xyxy_to_cxcywh(xyxy):
+    """Convert (x1, y1, x2, y2) boxes to (center x, center y, width, height)"""
+    xyxy = np.asarray(xyxy, dtype=np.float64)
+    return np.column_stack([(xyxy[:, :2] + xyxy[:, 2:]) / 2, xyxy[:, 2:] - xyxy[:, :2]])
+
+def cxcywh_to_xyxy(cxcywh):
+    """Convert (center x, center y, width, height) boxes to (x1, y1, x2, y2)"""
+    half = np.maximum(cxcywh[:, 2:], 1) / 2
+    return np.column_stack([cxcywh[:, :2] - half, cxcywh[:, :2] + half])
+
+def transition_matrix(steps):
+    """Constant-velocity state transition over a number of frames"""
+    matrix = np.eye(8)
+    matrix[np.arange(4), np.arange(4) + 4] = steps
+    return matrix
+
+class Tracker:
+    """
+    Multi-object tracker for detections that arrive only on keyframes
+    
+    Tracks are matched to detections by IoU (same class only) and smoothed
+    with a constant-velocity Kalman filter over [cx, cy, w, h] and their
+    velocities in pixels per frame. All tracks are filtered together with
+    stacked NumPy arrays. Between keyframes, predict() extrapolates the
+    boxes so every frame has detections.
+    """
+    def __init__(self, config):
+        tracking = config['analysis'].get('tracking', {})
+        self.enabled = tracking.get('enabled', True)
+        self.iou_threshold = tracking.get('iou_threshold', 0.3)
+        self.max_age = tracking.get('max_age', 3)
+        self.min_hits = tracking.get('min_hits', 1)
+        self.reset()
+    
+    def reset(self):
+        """Drop all tracks"""
+        self.state = np.zeros((0, 8))
+        self.covariance = np.zeros((0, 8, 8))
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.class_id = np.zeros(0, dtype=np.int32)
+        self.conf = np.zeros(0, dtype=np.float32)
+        self.hits = np.zeros(0, dtype=np.int32)
+        self.misses = np.zeros(0, dtype=np.int32)
+        self.frame_index = None
+        self.class_names = np.empty(0, dtype=object)
+        self.next_id = 1
+    
+    def _process_noise(self, heights, steps):
+        """Stacked process noise covariance for a number of frames"""
+        std = np.concatenate([np.repeat(STD_WEIGHT_POSITION * heights[:, None], 4, axis=1),
+                              np.repeat(STD_WEIGHT_VELOCITY * heights[:, None], 4, axis=1)], axis=1)
+        return np.einsum('ij,jk->ijk', std ** 2 * steps, np.eye(8))
+    
+    def _propagate(self, steps):
+        """Advance all track states and covariances by a number of frames"""
+        transition = transition_matrix(steps)
+        state = self.state @ transition.T
+        covariance = transition @ self.covariance @ transition.T
+        covariance += self._process_noise(np.maximum(self.state[:, 3], 1), steps)
+        return state, covariance
+    
+    def _match(self, detections):
+        """
+        Greedily match tracks to detections by descending IoU
+        
+        Returns:
+            track indices and detection indices of the matched pairs
+        """
+        if not len(self.ids) or not len(detections):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        
+        iou = box_iou(cxcywh_to_xyxy(self.state[:, :4]), detections.xyxy)
+        iou[self.class_id[:, None] != detections.class_id[None, :]] = 0
+        
+        track_indices, detection_indices = np.nonzero(iou >= self.iou_threshold)
+        order = np.argsort(-iou[track_indices, detection_indices], kind='stable')
+        
+        used_tracks = set()
+        used_detections = set()
+        matches = []
+        for track, detection in zip(track_indices[order].tolist(), detection_indices[order].tolist()):
+            if track in used_tracks or detection in used_detections:
+                continue
+            used_tracks.add(track)
+            used_detections.add(detection)
+            matches.append((track, detection))
+        
+        matches = np.array(matches, dtype=np.int64).reshape(-1, 2)
+        return matches[:, 0], matches[:, 1]
+    
+    def update(self, detections, frame_index):
+        """
+        Update the tracks with the detections of a keyframe
+        
+        Args:
+            detections: DetectionBatch (or list of detection dictionaries)
+            frame_index: Index of the keyframe in the source
+            
+        Returns:
+            The detections with a track_id column
+        """
+        detections = as_detection_batch(detections)
+        self.class_names = detections.class_names
+        
+        if self.frame_index is not None and len(self.ids) and frame_index > self.frame_index:
+            self.state, self.covariance = self._propagate(frame_index - self.frame_index)
+        self.frame_index = frame_index
+        
+        track_indices, detection_indices = self._match(detections)
+        measurements = xyxy_to_cxcywh(detections.xyxy)
+        
+        # Kalman update of the matched tracks
+        if len(track_indices):
+            state = self.state[track_indices]
+            covariance = self.covariance[track_indices]
+            heights = np.maximum(state[:, 3], 1)
+            measurement_std = np.repeat(STD_WEIGHT_POSITION * heights[:, None], 4, axis=1)
+            measurement_noise = np.einsum('ij,jk->ijk', measurement_std ** 2, np.eye(4))
+            
+            innovation_cov = covariance[:, :4, :4] + measurement_noise
+            gain = np.linalg.solve(innovation_cov, covariance[:, :4, :]).transpose(0, 2, 1)
+            residual = measurements[detection_indices] - state[:, :4]
+            
+            self.state[track_indices] = state + np.einsum('ijk,ik->ij', gain, residual)
+            self.covariance[track_indices] = covariance - gain @ covariance[:, :4, :]
+            self.class_id[track_indices] = detections.class_id[detection_indices]
+            self.conf[track_indices] = detections.conf[detection_indices]
+            self.hits[track_indices] += 1
+            self.misses[track_indices] = 0
+        
+        detection_ids = np.zeros(len(detections), dtype=np.int64)
+        detection_ids[detection_indices] = self.ids[track_indices]
+        
+        # Age unmatched tracks and drop the stale ones
+        unmatched = np.ones(len(self.ids), dtype=bool)
+        unmatched[track_indices] = False
+        self.misses[unmatched] += 1
+        self._keep(self.misses <= self.max_age)
+        
+        # Start new tracks for unmatched detections
+        new = np.ones(len(detections), dtype=bool)
+        new[detection_indices] = False
+        if new.any():
+            detection_ids[new] = self._start_tracks(measurements[new], detections.select(new))
+        
+        return detections.with_track_ids(detection_ids)
+    
+    def _keep(self, mask):
+        """Keep only the tracks selected by a mask"""
+        self.state = self.state[mask]
+        self.covariance = self.covariance[mask]
+        self.ids = self.ids[mask]
+        self.class_id = self.class_id[mask]
+        self.conf = self.conf[mask]
+        self.hits = self.hits[mask]
+        self.misses = self.misses[mask]
+    
+    def _start_tracks(self, measurements, detections):
+        """Create tracks for new detections and return their ids"""
+        count = len(measurements)
+        ids = np.arange(self.next_id, self.next_id + count, dtype=np.int64)
+        self.next_id += count
+        
+        heights = np.maximum(measurements[:, 3], 1)
+        std = np.concatenate([np.repeat(2 * STD_WEIGHT_POSITION * heights[:, None], 4, axis=1),
+                              np.repeat(10 * STD_WEIGHT_VELOCITY * heights[:, None], 4, axis=1)], axis=1)
+        
+        self.state = np.concatenate([self.state, np.column_stack([measurements, np.zeros((count, 4))])])
+        self.covariance = np.concatenate([self.covariance, np.einsum('ij,jk->ijk', std ** 2, np.eye(8))])
+        self.ids = np.concatenate([self.ids, ids])
+        self.class_id = np.concatenate([self.class_id, detections.class_id])
+        self.conf = np.concatenate([self.conf, detections.conf])
+        self.hits = np.concatenate([self.hits, np.ones(count, dtype=np.int32)])
+        self.misses = np.concatenate([self.misses, np.zeros(count, dtype=np.int32)])
+        return ids
+    
+    def predict(self, frame_index):
+        """
+        Predict the boxes of the active tracks for a frame between keyframes
+        
+        Args:
+            frame_index: Index of the frame in the source
+            
+        Returns:
+            DetectionBatch with predicted boxes and track ids
+        """
+        active = (self.misses == 0) & (self.hits >= self.min_hits)
+        if self.frame_index is None or not active.any():
+            return DetectionBatch.empty(self.class_names).with_track_ids(np.zeros(0, dtype=np.int64))
+        
+        steps = max(frame_index - self.frame_index, 0)
+        state = self.state[active] @ transition_matrix(steps).T
+        return DetectionBatch(np.round(cxcywh_to_xyxy(state[:, :4])), self.conf[active],
+                              self.class_id[active], self.class_names, self.ids[active])
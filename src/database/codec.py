@@ -0,0 +1,98 @@
+import struct
+import numpy as np
+
+# Binary layout of the boxes of one frame (frames.boxes), all little-endian:
+#   header: format version (u8), flags (u8), box count N (u32)
+#   class ids (N x u16), confidences quantized to 0-255 (N x u8),
+#   x1, y1, x2, y2 per box (N x 4 x u16), track ids (N x i32, only with FLAG_TRACK_ID)
+FORMAT_VERSION = 1
+FLAG_TRACK_ID = 1
+
+HEADER = struct.Struct('<BBI')
+
+def encode_boxes(detections):
+    """
+    Pack the boxes of a DetectionBatch into a BLOB
+    
+    Confidences are stored with a resolution of 1/255 and coordinates are
+    clipped to 0-65535.
+    
+    Args:
+        detections: DetectionBatch
+    
+    Returns:
+        bytes
+    """
+    count = len(detections.conf)
+    flags = FLAG_TRACK_ID if detections.track_id is not None else 0
+    parts = [
+        HEADER.pack(FORMAT_VERSION, flags, count),
+        detections.class_id.astype('<u2').tobytes(),
+        np.rint(np.clip(detections.conf, 0, 1) * 255).astype(np.uint8).tobytes(),
+        np.clip(detections.xyxy, 0, 0xFFFF).astype('<u2').tobytes()
+    ]
+    if flags & FLAG_TRACK_ID:
+        parts.append(detections.track_id.astype('<i4').tobytes())
+    return b''.join(parts)
+
+def decode_boxes(blob):
+    """
+    Unpack a BLOB written by encode_boxes
+    
+    Args:
+        blob: bytes (None or empty for a frame stored without boxes)
+    
+    Returns:
+        Dictionary of NumPy arrays: class_id (N int32), conf (N float32),
+        xyxy (N x 4 int32) and track_id (N int64, or None)
+    """
+    if not blob:
+        return {'class_id': np.empty(0, dtype=np.int32), 'conf': np.empty(0, dtype=np.float32),
+                'xyxy': np.empty((0, 4), dtype=np.int32), 'track_id': None}
+    
+    version, flags, count = HEADER.unpack_from(blob)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported box format version: {version}")
+    
+    offset = HEADER.size
+    class_id = np.frombuffer(blob, dtype='<u2', count=count, offset=offset)
+    offset += 2 * count
+    conf = np.frombuffer(blob, dtype=np.uint8, count=count, offset=offset)
+    offset += count
+    xyxy = np.frombuffer(blob, dtype='<u2', count=4 * count, offset=offset)
+    offset += 8 * count
+    track_id = None
+    if flags & FLAG_TRACK_ID:
+        track_id = np.frombuffer(blob, dtype='<i4', count=count, offset=offset).astype(np.int64)
+    
+    return {
+        'class_id': class_id.astype(np.int32),
+        'conf': conf.astype(np.float32) / 255,
+        'xyxy': xyxy.astype(np.int32).reshape(-1, 4),
+        'track_id': track_id
+    }
+
+def decode_many(blobs):
+    """
+    Unpack the boxes of many frames into one set of arrays
+    
+    Args:
+        blobs: Sequence of BLOBs (None for frames stored without boxes)
+    
+    Returns:
+        Dictionary of NumPy arrays over all boxes: class_id, conf, xyxy,
+        track_id (-1 where a frame had no track ids) and frame (position of
+        the box's BLOB in blobs)
+    """
+    decoded = [decode_boxes(blob) for blob in blobs]
+    counts = np.array([len(d['conf']) for d in decoded], dtype=np.int64)
+    if not decoded:
+        decoded = [decode_boxes(None)]
+    return {
+        'class_id': np.concatenate([d['class_id'] for d in decoded]),
+        'conf': np.concatenate([d['conf'] for d in decoded]),
+        'xyxy': np.concatenate([d['xyxy'] for d in decoded]),
+        'track_id': np.concatenate([d['track_id'] if d['track_id'] is not None
+                                    else np.full(len(d['conf']), -1, dtype=np.int64) for d in decoded]),
+        'frame': np.repeat(np.arange(len(counts)), counts)
+    }
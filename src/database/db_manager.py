@@ -1,164 +1,452 @@
 import sqlite3
-import json
 import os
+import time
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
+from ..detection.detection_batch import as_detection_batch
+from .writer import DetectionWriter
+from .retention import RetentionWorker
+from .queries import build_page_query, to_columns, OUTPUTS
+from .codec import encode_boxes, decode_many
+from .schema import initialize_schema, get_or_create_id, to_epoch_ms, from_epoch_ms, MAX_FRAME_DURATION_MS
+from .rollups import RollupAccumulator, RESOLUTIONS, TOTAL_REGION, rebuild_rollups
+
 class DatabaseManager:
+    """
+    SQLite storage for detections, alerts and video statistics
+    
+    Each thread gets one long-lived connection (opened on first use), so
+    statements stay prepared in the connection's cache and no call pays
+    for a connect. Connections of threads that have ended are closed when
+    the next thread opens one. Connections run in WAL mode, so readers do not block
+    the writer, with synchronous=NORMAL: commits do not fsync, only
+    checkpoints do. Every public method is safe to call from any thread.
+    """
     def __init__(self, config):
-        self.db_path = config['database']['path']
+        database_config = config['database']
+        self.db_path = database_config['path']
+        self.journal_mode = database_config.get('journal_mode', 'WAL')
+        self.synchronous = database_config.get('synchronous', 'NORMAL')
+        self.cache_size_mb = database_config.get('cache_size_mb', 16)
+        self.busy_timeout = database_config.get('busy_timeout', 5)
+        self.store_boxes = database_config.get('store_boxes', True)
+        self.class_ids = config.get('detection', {}).get('classes')
+        self._ids = {}
+        self._classes = set()
+        self._last_frame_ts = {}
+        self._frames_lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self._initialize_db()
+        
+        # Optional background group-commit writer for detection records
+        writer_config = database_config.get('writer', {})
+        self.writer = DetectionWriter(self, writer_config) if writer_config.get('enabled', False) else None
+        
+        # Optional background retention (deletes expired rows)
+        retention_config = database_config.get('retention', {})
+        self.retention = RetentionWorker(self, retention_config) if retention_config.get('enabled', False) else None
+    
+    def _connection(self):
+        """Get the calling thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Only the owning thread uses the connection; close() may close it from another thread
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            # Only takes effect on a new database, before journal_mode writes its header
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute(f'PRAGMA journal_mode={self.journal_mode}')
+            conn.execute(f'PRAGMA synchronous={self.synchronous}')
+            conn.execute(f'PRAGMA cache_size={-int(self.cache_size_mb * 1024)}')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            conn.execute('PRAGMA foreign_keys=ON')
+            self._local.conn = conn
+            with self._connections_lock:
+                # Close the connections of threads that have ended (e.g. one per dashboard rerun)
+                alive = []
+                for thread, thread_conn in self._connections:
+                    if thread.is_alive():
+                        alive.append((thread, thread_conn))
+                    else:
+                        thread_conn.close()
+                alive.append((threading.current_thread(), conn))
+                self._connections = alive
+        return conn
+    
+    @contextmanager
+    def _transaction(self):
+        """
+        Cursor in a transaction on the thread's connection, committed on success
+        
+        Ids, class ids and frame times cached during the transaction are staged
+        and only merged into the caches after the commit, so a rollback does
+        not leave the caches pointing at rows that do not exist.
+        """
+        conn = self._connection()
+        staged = self._local.staged = {'ids': {}, 'classes': set(), 'last_frame_ts': {}}
+        try:
+            with conn:
+                yield conn.cursor()
+        finally:
+            self._local.staged = None
+        self._ids.update(staged['ids'])
+        self._classes.update(staged['classes'])
+        self._last_frame_ts.update(staged['last_frame_ts'])
+    
+    def close(self):
+        """Write the queued detection records and close the connections of all threads"""
+        if self.retention is not None:
+            self.retention.close()
+        if self.writer is not None:
+            self.writer.close()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for _, conn in connections:
+            conn.close()
+        self._local = threading.local()
     
     def _initialize_db(self):
-        """Create database and tables if they don't exist"""
+        """Create database and tables if they don't exist, migrating older schemas"""
         # Ensure directory exists
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Create tables
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS detections (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            total_count INTEGER,
-            total_people INTEGER,
-            video_source TEXT,
-            detection_data TEXT
-        )
-        ''')
-        
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS alerts (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            region TEXT,
-            count INTEGER,
-            max_count INTEGER,
-            message TEXT,
-            video_source TEXT
-        )
-        ''')
-        
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS videos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            filename TEXT,
-            processed_timestamp TEXT,
-            total_frames INTEGER,
-            duration_seconds REAL,
-            avg_people_count REAL
-        )
-        ''')
+        initialize_schema(self._connection(), self.class_ids)
+    
+    def incremental_vacuum(self, pages=0):
+        """
+        Return free pages to the file system (auto_vacuum=INCREMENTAL databases)
         
-        conn.commit()
-        conn.close()
+        Args:
+            pages: Number of pages to release at most, 0 for all
+        """
+        # executescript steps the pragma to completion, execute frees a single page
+        self._connection().executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+    
+    def compact(self):
+        """
+        Shrink the database file
+        
+        A database created without incremental auto-vacuum is switched to it
+        with a full VACUUM (rewrites the whole file, blocks writers while it
+        runs). Otherwise all free pages are released. The WAL file is
+        truncated afterwards.
+        """
+        conn = self._connection()
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+        else:
+            self.incremental_vacuum()
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    
+    def _lookup_id(self, cursor, table, name):
+        """Cached id of a source or region name (staged until the transaction commits)"""
+        key = (table, name)
+        staged = self._local.staged['ids']
+        lookup_id = self._ids.get(key, staged.get(key))
+        if lookup_id is None:
+            lookup_id = get_or_create_id(cursor, table, name)
+            staged[key] = lookup_id
+        return lookup_id
     
     def save_detection(self, analysis_results, detections, video_source="unknown"):
-        """Save detection and analysis results to database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Save detection and analysis results to database (queued when the background writer is enabled)"""
+        record = (int(time.time() * 1000), analysis_results, detections, video_source)
+        if self.writer is not None:
+            self.writer.submit(record)
+        else:
+            self.save_detections([record])
+    
+    def save_detections(self, records):
+        """
+        Save several detection records in one transaction
         
-        timestamp = datetime.now().isoformat()
-        total_count = analysis_results['total_count']
-        total_people = analysis_results.get('total_people', 0)
-        
-        detection_data = json.dumps({
-            'counts': analysis_results['counts'],
-            'anomalies': analysis_results['anomalies'],
-            'detections': [
-                {
-                    'class_name': d['class_name'],
-                    'confidence': d['confidence'],
-                    'center': d['center']
-                } for d in detections
-            ]
-        })
-        
-        cursor.execute(
-            'INSERT INTO detections (timestamp, total_count, total_people, video_source, detection_data) VALUES (?, ?, ?, ?, ?)',
-            (timestamp, total_count, total_people, video_source, detection_data)
-        )
+        Each record becomes a frames row (with store_boxes, its detections
+        packed into the boxes BLOB) and one region_counts row per region. A frame's
+        duration is the time since the previous frame of its source.
+        The minute and hour rollups are updated in the same transaction.
+        
+        Args:
+            records: List of (epoch ms, analysis_results, detections, video_source) tuples
+        """
+        with self._frames_lock, self._transaction() as cursor:
+            region_rows = []
+            rollups = RollupAccumulator()
+            total_region_id = self._lookup_id(cursor, 'regions', TOTAL_REGION)
+            last_frame_ts = self._local.staged['last_frame_ts']
+            for ts, analysis_results, detections, video_source in records:
+                source_id = self._lookup_id(cursor, 'sources', video_source)
+                duration_ms = ts - last_frame_ts.get(source_id, self._last_frame_ts.get(source_id, ts))
+                duration_ms = duration_ms if 0 <= duration_ms <= MAX_FRAME_DURATION_MS else 0
+                last_frame_ts[source_id] = ts
+                
+                boxes = None
+                if self.store_boxes:
+                    detections = as_detection_batch(detections)
+                    self._save_classes(cursor, detections)
+                    boxes = encode_boxes(detections)
+                
+                cursor.execute(
+                    'INSERT INTO frames (source_id, ts, duration_ms, total_count, total_people, boxes) VALUES (?, ?, ?, ?, ?, ?)',
+                    (source_id, ts, duration_ms, analysis_results['total_count'], analysis_results.get('total_people', 0), boxes)
+                )
+                frame_id = cursor.lastrowid
+                
+                anomalies = analysis_results['anomalies']
+                for region, count in analysis_results['counts'].items():
+                    region_id = self._lookup_id(cursor, 'regions', region)
+                    anomaly = int(anomalies.get(region, False))
+                    region_rows.append((frame_id, region_id, source_id, ts, count, anomaly))
+                    rollups.add_count(source_id, region_id, ts, count, duration_ms * anomaly)
+                rollups.add_count(source_id, total_region_id, ts, analysis_results.get('total_people', 0))
+            
+            cursor.executemany(
+                'INSERT INTO region_counts (frame_id, region_id, source_id, ts, count, anomaly) VALUES (?, ?, ?, ?, ?, ?)',
+                region_rows
+            )
+            rollups.write(cursor)
+    
+    def _save_classes(self, cursor, detections):
+        """Store the names of class ids not seen before (staged until the transaction commits)"""
+        staged = self._local.staged['classes']
+        for class_id in set(detections.class_id.tolist()) - self._classes - staged:
+            name = detections.class_names[class_id] if class_id < len(detections.class_names) else None
+            if name is not None:
+                cursor.execute('INSERT OR REPLACE INTO classes (id, name) VALUES (?, ?)', (class_id, name))
+            staged.add(class_id)
+    
+    def save_line_crossings(self, lines, video_source="unknown"):
+        """Save a snapshot of the cumulative in/out counts of the counting lines (end of a source, or periodically)"""
+        if not lines:
+            return
         
-        conn.commit()
-        conn.close()
+        timestamp = datetime.now().isoformat()
+        with self._transaction() as cursor:
+            cursor.executemany(
+                'INSERT INTO line_crossings (timestamp, line, in_count, out_count, video_source) VALUES (?, ?, ?, ?, ?)',
+                [(timestamp, line, counts['in'], counts['out'], video_source) for line, counts in lines.items()]
+            )
     
     def save_alerts(self, alerts, video_source="unknown"):
-        """Save triggered alerts to database"""
+        """Save triggered alerts (dictionary by region, or list) to database"""
         if not alerts:
             return
             
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        for region, alert in alerts.items():
-            cursor.execute(
+        alerts = list(alerts.values() if isinstance(alerts, dict) else alerts)
+        with self._transaction() as cursor:
+            cursor.executemany(
                 'INSERT INTO alerts (timestamp, region, count, max_count, message, video_source) VALUES (?, ?, ?, ?, ?, ?)',
-                (alert['timestamp'], alert['region'], alert['count'], alert['max_count'], alert['message'], video_source)
+                [(alert['timestamp'], alert['region'], alert['count'], alert['max_count'], alert['message'], video_source)
+                 for alert in alerts]
             )
-        
-        conn.commit()
-        conn.close()
+            
+            # Count the alerts in the rollups
+            rollups = RollupAccumulator()
+            source_id = self._lookup_id(cursor, 'sources', video_source)
+            for alert in alerts:
+                rollups.add_alert(source_id, self._lookup_id(cursor, 'regions', alert['region']),
+                                  to_epoch_ms(alert['timestamp']))
+            rollups.write(cursor)
     
     def save_video_stats(self, filename, total_frames, duration_seconds, avg_people_count):
         """Save video processing statistics"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         timestamp = datetime.now().isoformat()
         
-        cursor.execute(
-            'INSERT INTO videos (filename, processed_timestamp, total_frames, duration_seconds, avg_people_count) VALUES (?, ?, ?, ?, ?)',
-            (filename, timestamp, total_frames, duration_seconds, avg_people_count)
+        with self._transaction() as cursor:
+            cursor.execute(
+                'INSERT INTO videos (filename, processed_timestamp, total_frames, duration_seconds, avg_people_count) VALUES (?, ?, ?, ?, ?)',
+                (filename, timestamp, total_frames, duration_seconds, avg_people_count)
+            )
+    
+    def get_recent_detections(self, limit=100):
+        """Get recent frame records with their region counts"""
+        conn = self._connection()
+        frames = conn.execute(
+            'SELECT frames.id, frames.ts, frames.duration_ms, frames.total_count, frames.total_people, '
+            'sources.name AS video_source FROM frames JOIN sources ON sources.id = frames.source_id '
+            'ORDER BY frames.ts DESC LIMIT ?',
+            (limit,)
+        ).fetchall()
+        
+        results = [dict(row, timestamp=from_epoch_ms(row['ts']), counts={}, anomalies={}) for row in frames]
+        if results:
+            by_frame = {result['id']: result for result in results}
+            rows = conn.execute(
+                'SELECT region_counts.frame_id, regions.name, region_counts.count, region_counts.anomaly '
+                'FROM region_counts JOIN regions ON regions.id = region_counts.region_id '
+                f'WHERE region_counts.frame_id IN ({",".join("?" * len(by_frame))})',
+                list(by_frame)
+            )
+            for frame_id, region, count, anomaly in rows:
+                by_frame[frame_id]['counts'][region] = count
+                by_frame[frame_id]['anomalies'][region] = bool(anomaly)
+        
+        return results
+    
+    def rebuild_rollups(self, since=None):
+        """
+        Rebuild the minute and hour rollups from the raw rows (backfill)
+        
+        Args:
+            since: Optional datetime; only buckets from then on are rebuilt
+            
+        Returns:
+            Number of rollup rows written
+        """
+        since_ms = int(since.timestamp() * 1000) if since is not None else None
+        with self._frames_lock, self._transaction() as cursor:
+            written = rebuild_rollups(cursor, since_ms)
+        return written
+    
+    def get_rollups(self, resolution='minute', source=None, region=None, start=None, end=None):
+        """
+        Get aggregated counts per bucket, source and region
+        
+        Args:
+            resolution: 'minute' or 'hour'
+            source: Optional video source name
+            region: Optional region name ('total' for the per-source people totals)
+            start: Optional datetime, first bucket
+            end: Optional datetime, buckets before this
+            
+        Returns:
+            List of dictionaries with timestamp, source, region, samples, avg,
+            max, anomaly_seconds and alerts, ordered by time
+        """
+        conditions = ['region_rollups.resolution_ms = ?']
+        params = [RESOLUTIONS[resolution]]
+        if source is not None:
+            conditions.append('sources.name = ?')
+            params.append(source)
+        if region is not None:
+            conditions.append('regions.name = ?')
+            params.append(region)
+        if start is not None:
+            conditions.append('region_rollups.bucket_ts >= ?')
+            params.append(int(start.timestamp() * 1000))
+        if end is not None:
+            conditions.append('region_rollups.bucket_ts < ?')
+            params.append(int(end.timestamp() * 1000))
+        
+        cursor = self._connection().execute(
+            'SELECT region_rollups.bucket_ts, sources.name AS source, regions.name AS region, region_rollups.samples, '
+            'CAST(region_rollups.sum_count AS REAL) / MAX(region_rollups.samples, 1) AS avg, '
+            'region_rollups.max_count AS max, region_rollups.anomaly_ms / 1000.0 AS anomaly_seconds, region_rollups.alerts '
+            'FROM region_rollups JOIN sources ON sources.id = region_rollups.source_id '
+            'JOIN regions ON regions.id = region_rollups.region_id '
+            f'WHERE {" AND ".join(conditions)} ORDER BY region_rollups.bucket_ts',
+            params
         )
         
-        conn.commit()
-        conn.close()
+        return [dict(row, timestamp=from_epoch_ms(row['bucket_ts'])) for row in cursor.fetchall()]
     
-    def get_recent_detections(self, limit=100):
-        """Get recent detection records"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+    def stream(self, table, columns=None, source=None, region=None, start=None, end=None,
+               after=None, batch_size=1000, output='rows'):
+        """
+        Iterate over a table in time order without loading it into memory
         
-        cursor.execute(
-            'SELECT * FROM detections ORDER BY timestamp DESC LIMIT ?',
-            (limit,)
+        Rows are read in pages of batch_size with keyset pagination: each page
+        is a short indexed query continuing after the sort key of the previous
+        page's last row, so no read transaction stays open between pages.
+        
+        Args:
+            table: 'frames', 'region_counts', 'alerts', 'line_crossings' or 'videos'
+            columns: Optional list of column names to return (default: all)
+            source: Optional video source name (videos: filename)
+            region: Optional region name (line_crossings: line name)
+            start: Optional datetime, first row time
+            end: Optional datetime, rows before this
+            after: Optional sort key to continue after, as yielded with output='rows'
+                (the '_key' entry)
+            batch_size: Rows per page
+            output: 'rows' (one dictionary per row), 'numpy' ({column: array} per
+                page) or 'pandas' (DataFrame per page)
+            
+        Yields:
+            Rows or column batches
+        """
+        if output not in OUTPUTS:
+            raise ValueError(f"Unknown output: {output}")
+        select, source_sql, conditions, params, names, key = build_page_query(
+            table, columns, source, region, start, end
         )
         
-        results = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        conn = self._connection()
+        while True:
+            page_conditions = list(conditions)
+            page_params = list(params)
+            if after is not None:
+                page_conditions.append(f'({", ".join(key)}) > ({", ".join("?" * len(key))})')
+                page_params.extend(after)
+            where = f'WHERE {" AND ".join(page_conditions)} ' if page_conditions else ''
+            rows = conn.execute(
+                f'SELECT {select} FROM {source_sql} {where}ORDER BY {", ".join(key)} LIMIT ?',
+                page_params + [batch_size]
+            ).fetchall()
+            if not rows:
+                return
+            
+            after = tuple(rows[-1])[len(names):]
+            if output == 'rows':
+                for row in rows:
+                    values = tuple(row)
+                    yield dict(zip(names, values), _key=values[len(names):])
+            else:
+                yield to_columns(rows, names, output)
+            
+            if len(rows) < batch_size:
+                return
+    
+    def stream_boxes(self, source=None, start=None, end=None, after=None, batch_size=1000):
+        """
+        Iterate over the stored boxes as NumPy arrays, one page of frames at a time
         
-        return results
+        Args:
+            source: Optional video source name
+            start: Optional datetime, first frame time
+            end: Optional datetime, frames before this
+            after: Optional frames sort key to continue after
+            batch_size: Frames per page
+            
+        Yields:
+            Dictionaries of arrays over the boxes of a page: class_id, conf, xyxy,
+            track_id (-1 without tracking), frame_id and ts
+        """
+        for page in self.stream('frames', columns=['id', 'ts', 'boxes'], source=source, start=start, end=end,
+                                after=after, batch_size=batch_size, output='numpy'):
+            boxes = decode_many(page['boxes'])
+            boxes['frame_id'] = page['id'][boxes['frame']]
+            boxes['ts'] = page['ts'][boxes['frame']]
+            del boxes['frame']
+            yield boxes
     
     def get_recent_alerts(self, limit=100):
         """Get recent alert records"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute(
+        cursor = self._connection().execute(
             'SELECT * FROM alerts ORDER BY timestamp DESC LIMIT ?',
             (limit,)
         )
         
-        results = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def get_line_crossings(self, limit=100):
+        """Get recent line crossing counts"""
+        cursor = self._connection().execute(
+            'SELECT * FROM line_crossings ORDER BY timestamp DESC LIMIT ?',
+            (limit,)
+        )
         
-        return results
+        return [dict(row) for row in cursor.fetchall()]
     
     def get_processed_videos(self, limit=100):
         """Get processed video statistics"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute(
+        cursor = self._connection().execute(
             'SELECT * FROM videos ORDER BY processed_timestamp DESC LIMIT ?',
             (limit,)
         )
         
-        results = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        
-        return results
+        return [dict(row) for row in cursor.fetchall()]
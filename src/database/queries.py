@@ -0,0 +1,156 @@
+import numpy as np
+from datetime import datetime
+
+# Streamable tables: FROM clause, selectable columns, keyset (sort key, unique),
+# time column and how its values are stored, source and region filters, and optionally
+# another FROM clause, keyset and time column for scans without source and region filters
+STREAMS = {
+    'frames': {
+        'from': 'frames JOIN sources ON sources.id = frames.source_id',
+        'columns': {
+            'id': 'frames.id',
+            'ts': 'frames.ts',
+            'duration_ms': 'frames.duration_ms',
+            'total_count': 'frames.total_count',
+            'total_people': 'frames.total_people',
+            'source': 'sources.name',
+            'boxes': 'frames.boxes'
+        },
+        'key': ('frames.ts', 'frames.id'),
+        'time': ('frames.ts', 'ms'),
+        'source': 'frames.source_id = (SELECT id FROM sources WHERE name = ?)',
+        'region': None
+    },
+    'region_counts': {
+        'from': 'region_counts JOIN sources ON sources.id = region_counts.source_id '
+                'JOIN regions ON regions.id = region_counts.region_id',
+        'columns': {
+            'frame_id': 'region_counts.frame_id',
+            'ts': 'region_counts.ts',
+            'source': 'sources.name',
+            'region': 'regions.name',
+            'count': 'region_counts.count',
+            'anomaly': 'region_counts.anomaly'
+        },
+        'key': ('region_counts.ts', 'region_counts.frame_id', 'region_counts.region_id'),
+        'time': ('region_counts.ts', 'ms'),
+        'source': 'region_counts.source_id = (SELECT id FROM sources WHERE name = ?)',
+        'region': 'region_counts.region_id = (SELECT id FROM regions WHERE name = ?)',
+        'scan': {
+            # Frames in ts order (idx_frames_ts), their regions from the primary key
+            'from': 'frames JOIN region_counts ON region_counts.frame_id = frames.id '
+                    'JOIN sources ON sources.id = region_counts.source_id '
+                    'JOIN regions ON regions.id = region_counts.region_id',
+            'key': ('frames.ts', 'frames.id', 'region_counts.region_id'),
+            'time': ('frames.ts', 'ms')
+        }
+    },
+    'alerts': {
+        'from': 'alerts',
+        'columns': {
+            'id': 'alerts.id',
+            'timestamp': 'alerts.timestamp',
+            'source': 'alerts.video_source',
+            'region': 'alerts.region',
+            'count': 'alerts.count',
+            'max_count': 'alerts.max_count',
+            'message': 'alerts.message'
+        },
+        'key': ('alerts.timestamp', 'alerts.id'),
+        'time': ('alerts.timestamp', 'iso'),
+        'source': 'alerts.video_source = ?',
+        'region': 'alerts.region = ?'
+    },
+    'line_crossings': {
+        'from': 'line_crossings',
+        'columns': {
+            'id': 'line_crossings.id',
+            'timestamp': 'line_crossings.timestamp',
+            'source': 'line_crossings.video_source',
+            'line': 'line_crossings.line',
+            'in_count': 'line_crossings.in_count',
+            'out_count': 'line_crossings.out_count'
+        },
+        'key': ('line_crossings.timestamp', 'line_crossings.id'),
+        'time': ('line_crossings.timestamp', 'iso'),
+        'source': 'line_crossings.video_source = ?',
+        'region': 'line_crossings.line = ?'
+    },
+    'videos': {
+        'from': 'videos',
+        'columns': {
+            'id': 'videos.id',
+            'filename': 'videos.filename',
+            'processed_timestamp': 'videos.processed_timestamp',
+            'total_frames': 'videos.total_frames',
+            'duration_seconds': 'videos.duration_seconds',
+            'avg_people_count': 'videos.avg_people_count'
+        },
+        'key': ('videos.processed_timestamp', 'videos.id'),
+        'time': ('videos.processed_timestamp', 'iso'),
+        'source': 'videos.filename = ?',
+        'region': None
+    }
+}
+
+OUTPUTS = ('rows', 'numpy', 'pandas')
+
+def _time_value(value, storage):
+    """Convert a datetime (or epoch milliseconds) filter to the stored representation"""
+    if storage == 'ms':
+        return int(value.timestamp() * 1000) if isinstance(value, datetime) else int(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return datetime.fromtimestamp(value / 1000).isoformat()
+
+def build_page_query(table, columns=None, source=None, region=None, start=None, end=None):
+    """
+    SQL and parameters of one page of a stream, without the keyset condition
+    
+    Returns:
+        (select list, FROM clause, WHERE conditions, parameters, column names, key columns)
+    """
+    if table not in STREAMS:
+        raise ValueError(f"Unknown table to stream: {table}")
+    stream = STREAMS[table]
+    if source is None and region is None and 'scan' in stream:
+        stream = dict(stream, **stream['scan'])
+    names = list(stream['columns']) if columns is None else list(columns)
+    unknown = [name for name in names if name not in stream['columns']]
+    if unknown:
+        raise ValueError(f"Unknown columns for {table}: {', '.join(unknown)}")
+    
+    conditions, params = [], []
+    for label, value in (('source', source), ('region', region)):
+        if value is None:
+            continue
+        condition = stream[label]
+        if condition is None:
+            raise ValueError(f"{table} cannot be filtered by {label}")
+        conditions.append(condition)
+        params.append(value)
+    time_column, storage = stream['time']
+    if start is not None:
+        conditions.append(f'{time_column} >= ?')
+        params.append(_time_value(start, storage))
+    if end is not None:
+        conditions.append(f'{time_column} < ?')
+        params.append(_time_value(end, storage))
+    
+    # The key columns are selected after the projected ones to continue from the last row
+    select = [f'{stream["columns"][name]} AS "{name}"' for name in names] + list(stream['key'])
+    return ', '.join(select), stream['from'], conditions, params, names, stream['key']
+
+def to_columns(rows, names, output):
+    """Turn a page of rows into {column: NumPy array} or a pandas DataFrame"""
+    columns = {}
+    for i, name in enumerate(names):
+        values = [row[i] for row in rows]
+        columns[name] = np.array(values)
+        if columns[name].dtype.kind == 'S':
+            # Fixed-size bytes would drop trailing zero bytes of BLOBs
+            columns[name] = np.array(values, dtype=object)
+    if output == 'pandas':
+        import pandas as pd
+        return pd.DataFrame(columns)
+    return columns
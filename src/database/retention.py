@@ -0,0 +1,123 @@
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from .rollups import RESOLUTIONS
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+class RetentionWorker:
+    """
+    Background thread that applies the retention policy
+    
+    Every interval, raw frames (with their region counts and boxes) older
+    than raw_days, alerts and line crossings older than their own limits and
+    minute rollups older than minute_rollup_days are deleted. Hour rollups
+    are kept. The rollups are updated together with the raw rows, so the
+    deleted rows are already folded into them. Deletes run in chunks of
+    chunk_rows, each in its own short transaction with a pause in between,
+    so the write lock is never held for long. Afterwards the free pages are
+    released with an incremental vacuum. With start=False no thread is
+    started and apply() runs the policy on demand.
+    """
+    def __init__(self, db_manager, retention_config, start=True):
+        self.db_manager = db_manager
+        self.raw_days = retention_config.get('raw_days', 7)
+        self.alerts_days = retention_config.get('alerts_days', 90)
+        self.line_crossings_days = retention_config.get('line_crossings_days', 90)
+        self.minute_rollup_days = retention_config.get('minute_rollup_days', 30)
+        self.interval = retention_config.get('interval', 3600)
+        self.chunk_rows = retention_config.get('chunk_rows', 2000)
+        self.chunk_pause_ms = retention_config.get('chunk_pause_ms', 50)
+        self.vacuum_pages = retention_config.get('vacuum_pages', 2000)
+        self.logger = logging.getLogger('RetentionWorker')
+        
+        self.runs = 0
+        self.deleted = {}
+        self.closed = threading.Event()
+        self.thread = None
+        if start:
+            self.thread = threading.Thread(target=self._run, name='RetentionWorker', daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+    
+    def _delete_chunked(self, sql, params, stop):
+        """Repeat a chunked delete (one transaction per chunk) until nothing is left or stop is set"""
+        total = 0
+        while True:
+            with self.db_manager._transaction() as cursor:
+                cursor.execute(sql, params + (self.chunk_rows,))
+                deleted = cursor.rowcount
+            total += deleted
+            if deleted < self.chunk_rows or stop.wait(self.chunk_pause_ms / 1000):
+                return total
+    
+    def apply(self, now=None, stop=None):
+        """
+        Delete the expired rows once
+        
+        Args:
+            now: Optional current time in epoch milliseconds
+            stop: Optional threading.Event, ends the run after the current chunk
+        
+        Returns:
+            Dictionary of deleted rows by table
+        """
+        now = int(time.time() * 1000) if now is None else now
+        local_now = datetime.fromtimestamp(now / 1000)
+        stop = threading.Event() if stop is None else stop
+        deleted = {}
+        
+        # Region counts follow their frames (ON DELETE CASCADE), boxes are stored in them. The cutoff
+        # is aligned to the hour, so the oldest remaining rollup bucket keeps all its raw rows
+        raw_cutoff = now - int(self.raw_days * DAY_MS)
+        raw_cutoff -= raw_cutoff % RESOLUTIONS['hour']
+        deleted['frames'] = self._delete_chunked(
+            'DELETE FROM frames WHERE id IN (SELECT id FROM frames WHERE ts < ? LIMIT ?)',
+            (raw_cutoff,), stop
+        )
+        deleted['alerts'] = self._delete_chunked(
+            'DELETE FROM alerts WHERE id IN (SELECT id FROM alerts WHERE timestamp < ? LIMIT ?)',
+            ((local_now - timedelta(days=self.alerts_days)).isoformat(),), stop
+        )
+        deleted['line_crossings'] = self._delete_chunked(
+            'DELETE FROM line_crossings WHERE id IN (SELECT id FROM line_crossings WHERE timestamp < ? LIMIT ?)',
+            ((local_now - timedelta(days=self.line_crossings_days)).isoformat(),), stop
+        )
+        deleted['minute_rollups'] = self._delete_chunked(
+            'DELETE FROM region_rollups WHERE (resolution_ms, source_id, region_id, bucket_ts) IN '
+            '(SELECT resolution_ms, source_id, region_id, bucket_ts FROM region_rollups '
+            'WHERE resolution_ms = ? AND bucket_ts < ? LIMIT ?)',
+            (RESOLUTIONS['minute'], now - int(self.minute_rollup_days * DAY_MS)), stop
+        )
+        
+        self.db_manager.incremental_vacuum(self.vacuum_pages)
+        return deleted
+    
+    def _run(self):
+        """Apply the policy every interval until closed"""
+        while not self.closed.is_set():
+            try:
+                deleted = self.apply(stop=self.closed)
+                self.runs += 1
+                for table, count in deleted.items():
+                    self.deleted[table] = self.deleted.get(table, 0) + count
+                if any(deleted.values()):
+                    self.logger.info(f"Retention deleted {deleted}")
+            except Exception as e:
+                self.logger.error(f"Error applying retention: {e}")
+            self.closed.wait(self.interval)
+    
+    def metrics(self):
+        """Number of runs and rows deleted by table so far"""
+        return {'runs': self.runs, 'deleted': dict(self.deleted)}
+    
+    def close(self, timeout=None):
+        """Stop the worker (an unfinished run stops after its current chunk)"""
+        if self.closed.is_set():
+            return
+        self.closed.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
@@ -0,0 +1,116 @@
+from collections import defaultdict
+
+# Bucket sizes of the rollups in milliseconds
+RESOLUTIONS = {
+    'minute': 60 * 1000,
+    'hour': 60 * 60 * 1000
+}
+
+# Pseudo-region holding the per-source totals (total_people) and frame-wide alerts
+TOTAL_REGION = 'total'
+
+UPSERT = '''
+INSERT INTO region_rollups (resolution_ms, source_id, region_id, bucket_ts, samples, sum_count, max_count, anomaly_ms, alerts)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (resolution_ms, source_id, region_id, bucket_ts) DO UPDATE SET
+    samples = samples + excluded.samples,
+    sum_count = sum_count + excluded.sum_count,
+    max_count = MAX(max_count, excluded.max_count),
+    anomaly_ms = anomaly_ms + excluded.anomaly_ms,
+    alerts = alerts + excluded.alerts
+'''
+
+class RollupAccumulator:
+    """
+    Pre-aggregates the rollup updates of one write batch
+    
+    Every resolution, source, region and bucket touched by the batch
+    becomes a single UPSERT, so group-committed batches cost one
+    statement per bucket instead of one per row.
+    """
+    def __init__(self):
+        # [samples, sum_count, max_count, anomaly_ms, alerts] per key
+        self.buckets = defaultdict(lambda: [0, 0, 0, 0, 0])
+    
+    def add_count(self, source_id, region_id, ts, count, anomaly_ms=0):
+        """Add one sample of a region count (or total) at a time"""
+        for resolution_ms in RESOLUTIONS.values():
+            bucket = self.buckets[(resolution_ms, source_id, region_id, ts - ts % resolution_ms)]
+            bucket[0] += 1
+            bucket[1] += count
+            bucket[2] = max(bucket[2], count)
+            bucket[3] += anomaly_ms
+    
+    def add_alert(self, source_id, region_id, ts):
+        """Add one alert at a time"""
+        for resolution_ms in RESOLUTIONS.values():
+            self.buckets[(resolution_ms, source_id, region_id, ts - ts % resolution_ms)][4] += 1
+    
+    def write(self, cursor):
+        """UPSERT the accumulated buckets"""
+        if self.buckets:
+            cursor.executemany(UPSERT, [key + tuple(values) for key, values in self.buckets.items()])
+            self.buckets.clear()
+
+def rebuild_rollups(cursor, since_ms=None):
+    """
+    Recompute the rollups from the raw rows
+    
+    Buckets from since_ms on (default: from the oldest raw frame) are
+    deleted and rebuilt from frames, region_counts and alerts. Buckets
+    older than the oldest raw frame are always kept, their raw rows are
+    gone (retention).
+    
+    Returns:
+        Number of rollup rows written
+    """
+    oldest_ms = cursor.execute('SELECT MIN(ts) FROM frames').fetchone()[0]
+    if oldest_ms is None:
+        return 0
+    since_ms = oldest_ms if since_ms is None else max(since_ms, oldest_ms)
+    cursor.execute('INSERT OR IGNORE INTO regions (name) VALUES (?)', (TOTAL_REGION,))
+    cursor.execute('INSERT OR IGNORE INTO sources (name) SELECT DISTINCT video_source FROM alerts WHERE video_source IS NOT NULL')
+    cursor.execute('INSERT OR IGNORE INTO regions (name) SELECT DISTINCT region FROM alerts WHERE region IS NOT NULL')
+    total_region_id = cursor.execute('SELECT id FROM regions WHERE name = ?', (TOTAL_REGION,)).fetchone()[0]
+    
+    written = 0
+    for resolution_ms in RESOLUTIONS.values():
+        start = since_ms - since_ms % resolution_ms
+        cursor.execute('DELETE FROM region_rollups WHERE resolution_ms = ? AND bucket_ts >= ?', (resolution_ms, start))
+        
+        # Regions, with the anomaly time from the frame durations
+        cursor.execute('''
+            INSERT INTO region_rollups
+            SELECT ?, region_counts.source_id, region_counts.region_id, region_counts.ts - region_counts.ts % ?,
+                   COUNT(*), SUM(region_counts.count), MAX(region_counts.count),
+                   SUM(CASE WHEN region_counts.anomaly THEN frames.duration_ms ELSE 0 END), 0
+            FROM region_counts JOIN frames ON frames.id = region_counts.frame_id
+            WHERE region_counts.ts >= ?
+            GROUP BY 2, 3, 4
+        ''', (resolution_ms, resolution_ms, start))
+        written += cursor.rowcount
+        
+        # Per-source totals
+        cursor.execute('''
+            INSERT INTO region_rollups
+            SELECT ?, source_id, ?, ts - ts % ?, COUNT(*), SUM(total_people), MAX(total_people), 0, 0
+            FROM frames WHERE ts >= ?
+            GROUP BY 2, 4
+        ''', (resolution_ms, total_region_id, resolution_ms, start))
+        written += cursor.rowcount
+        
+        # Alerts (stored with local ISO timestamps)
+        cursor.execute('''
+            INSERT INTO region_rollups
+            SELECT ?, sources.id, regions.id, alert_ts - alert_ts % ?, 0, 0, 0, 0, COUNT(*)
+            FROM (SELECT CAST(ROUND((julianday(timestamp, 'utc') - 2440587.5) * 86400000) AS INTEGER) AS alert_ts,
+                         region, video_source FROM alerts) AS alert_times
+            JOIN sources ON sources.name = alert_times.video_source
+            JOIN regions ON regions.name = alert_times.region
+            WHERE alert_ts >= ?
+            GROUP BY 2, 3, 4
+            ON CONFLICT (resolution_ms, source_id, region_id, bucket_ts) DO UPDATE SET alerts = excluded.alerts
+        ''', (resolution_ms, resolution_ms, start))
+        written += cursor.rowcount
+    
+    return written
@@ -0,0 +1,287 @@
+import json
+from itertools import groupby
+from datetime import datetime
+
+import numpy as np
+
+from ..detection.detection_batch import DetectionBatch
+from .codec import encode_boxes
+from .rollups import rebuild_rollups
+
+# Current schema version, stored in PRAGMA user_version
+SCHEMA_VERSION = 5
+
+# Frames further apart than this do not extend each other's duration
+MAX_FRAME_DURATION_MS = 60000
+
+TABLES = [
+    '''
+    CREATE TABLE IF NOT EXISTS sources (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS regions (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS classes (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS frames (
+        id INTEGER PRIMARY KEY,
+        source_id INTEGER NOT NULL REFERENCES sources(id),
+        ts INTEGER NOT NULL,
+        duration_ms INTEGER NOT NULL DEFAULT 0,
+        total_count INTEGER NOT NULL,
+        total_people INTEGER NOT NULL,
+        boxes BLOB
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS region_counts (
+        frame_id INTEGER NOT NULL REFERENCES frames(id) ON DELETE CASCADE,
+        region_id INTEGER NOT NULL REFERENCES regions(id),
+        source_id INTEGER NOT NULL,
+        ts INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        anomaly INTEGER NOT NULL,
+        PRIMARY KEY (frame_id, region_id)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS region_rollups (
+        resolution_ms INTEGER NOT NULL,
+        source_id INTEGER NOT NULL,
+        region_id INTEGER NOT NULL,
+        bucket_ts INTEGER NOT NULL,
+        samples INTEGER NOT NULL,
+        sum_count INTEGER NOT NULL,
+        max_count INTEGER NOT NULL,
+        anomaly_ms INTEGER NOT NULL,
+        alerts INTEGER NOT NULL,
+        PRIMARY KEY (resolution_ms, source_id, region_id, bucket_ts)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        region TEXT,
+        count INTEGER,
+        max_count INTEGER,
+        message TEXT,
+        video_source TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS videos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT,
+        processed_timestamp TEXT,
+        total_frames INTEGER,
+        duration_seconds REAL,
+        avg_people_count REAL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS line_crossings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        line TEXT,
+        in_count INTEGER,
+        out_count INTEGER,
+        video_source TEXT
+    )
+    '''
+]
+
+# Covering indexes: time-range queries per source and per region never touch the tables.
+# Their leading columns follow the stream keysets (ts, id) and (ts, frame_id, region_id),
+# so every page of DatabaseManager.stream() is a range search without a sort. Unfiltered
+# region_counts scans walk idx_frames_ts and join the primary key instead of a third
+# covering index, which would be written for every region of every frame
+INDEXES = [
+    'CREATE INDEX IF NOT EXISTS idx_frames_source_key ON frames (source_id, ts, id, total_count, total_people, duration_ms)',
+    'CREATE INDEX IF NOT EXISTS idx_frames_ts ON frames (ts)',
+    'CREATE INDEX IF NOT EXISTS idx_region_counts_source_key ON region_counts (source_id, ts, frame_id, region_id, count, anomaly)',
+    'CREATE INDEX IF NOT EXISTS idx_region_counts_region_key ON region_counts (region_id, ts, frame_id, source_id, count, anomaly)',
+    'CREATE INDEX IF NOT EXISTS idx_region_rollups_region ON region_rollups (resolution_ms, region_id, bucket_ts)',
+    'CREATE INDEX IF NOT EXISTS idx_alerts_timestamp ON alerts (timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_videos_processed ON videos (processed_timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_line_crossings_timestamp ON line_crossings (timestamp)'
+]
+
+def to_epoch_ms(timestamp):
+    """Convert an ISO timestamp (local time) to integer epoch milliseconds"""
+    return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+
+def from_epoch_ms(ts):
+    """Convert integer epoch milliseconds to an ISO timestamp (local time)"""
+    return datetime.fromtimestamp(ts / 1000).isoformat()
+
+def get_or_create_id(cursor, table, name):
+    """Id of a name in a lookup table (sources, regions), inserted when missing"""
+    cursor.execute(f'INSERT OR IGNORE INTO {table} (name) VALUES (?)', (name,))
+    return cursor.execute(f'SELECT id FROM {table} WHERE name = ?', (name,)).fetchone()[0]
+
+def table_exists(cursor, table):
+    """Check if a table exists"""
+    return cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone() is not None
+
+def column_exists(cursor, table, column):
+    """Check if a table has a column"""
+    return any(row[1] == column for row in cursor.execute(f'PRAGMA table_info({table})'))
+
+def _legacy_rows(cursor, chunk_rows=1000):
+    """Legacy detection rows in insertion (time) order, read in rowid keyset chunks"""
+    last_rowid = -1
+    while True:
+        rows = cursor.connection.execute(
+            'SELECT rowid, timestamp, total_count, total_people, video_source, detection_data FROM detections '
+            'WHERE rowid > ? ORDER BY rowid LIMIT ?',
+            (last_rowid, chunk_rows)
+        ).fetchall()
+        if not rows:
+            return
+        last_rowid = rows[-1][0]
+        for row in rows:
+            yield row[1:]
+
+def _migrate_legacy_detections(cursor, class_ids):
+    """
+    Version 1: move the JSON detections table into frames and region_counts
+    
+    The legacy records only kept box centers, they become zero-size boxes.
+    Class names missing from class_ids get ids from 1000 up.
+    """
+    if not table_exists(cursor, 'detections'):
+        return
+    if not column_exists(cursor, 'frames', 'boxes'):
+        cursor.execute('ALTER TABLE frames ADD COLUMN boxes BLOB')
+    
+    class_ids = dict(class_ids or {})
+    class_ids.update({name: class_id for class_id, name in cursor.execute('SELECT id, name FROM classes')})
+    last_ts = {}
+    
+    for timestamp, total_count, total_people, video_source, detection_data in _legacy_rows(cursor):
+        try:
+            ts = to_epoch_ms(timestamp)
+            data = json.loads(detection_data or '{}')
+        except (TypeError, ValueError):
+            continue
+        
+        source_id = get_or_create_id(cursor, 'sources', video_source or 'unknown')
+        duration_ms = ts - last_ts[source_id] if source_id in last_ts else 0
+        duration_ms = duration_ms if 0 <= duration_ms <= MAX_FRAME_DURATION_MS else 0
+        last_ts[source_id] = ts
+        
+        boxes = []
+        for detection in data.get('detections', []):
+            name = detection.get('class_name')
+            if name not in class_ids:
+                class_ids[name] = max([1000 - 1] + [i for i in class_ids.values() if i >= 1000]) + 1
+                cursor.execute('INSERT OR REPLACE INTO classes (id, name) VALUES (?, ?)', (class_ids[name], name))
+            x, y = detection.get('center', (0, 0))
+            boxes.append((class_ids[name], detection.get('confidence') or 0, x, y, x, y))
+        boxes = np.array(boxes, dtype=np.float64).reshape(-1, 6)
+        
+        cursor.execute(
+            'INSERT INTO frames (source_id, ts, duration_ms, total_count, total_people, boxes) VALUES (?, ?, ?, ?, ?, ?)',
+            (source_id, ts, duration_ms, total_count or 0, total_people or 0,
+             encode_boxes(DetectionBatch(boxes[:, 2:], boxes[:, 1], boxes[:, 0], None)))
+        )
+        frame_id = cursor.lastrowid
+        
+        anomalies = data.get('anomalies', {})
+        cursor.executemany(
+            'INSERT OR REPLACE INTO region_counts (frame_id, region_id, source_id, ts, count, anomaly) VALUES (?, ?, ?, ?, ?, ?)',
+            [(frame_id, get_or_create_id(cursor, 'regions', region), source_id, ts, count, int(bool(anomalies.get(region))))
+             for region, count in data.get('counts', {}).items()]
+        )
+    
+    cursor.executemany('INSERT OR IGNORE INTO classes (id, name) VALUES (?, ?)',
+                       [(class_id, name) for name, class_id in class_ids.items()])
+    cursor.execute('DROP TABLE detections')
+
+def _backfill_rollups(cursor, class_ids):
+    """Version 2: build the minute and hour rollups from the existing rows"""
+    rebuild_rollups(cursor)
+
+def _pack_boxes(cursor, class_ids):
+    """
+    Version 3: move the boxes table into the frames.boxes BLOB column
+    
+    Safe to run again: the column is only added when missing and the boxes
+    table is dropped once converted.
+    """
+    if not column_exists(cursor, 'frames', 'boxes'):
+        cursor.execute('ALTER TABLE frames ADD COLUMN boxes BLOB')
+    if not table_exists(cursor, 'boxes'):
+        return
+    
+    rows = cursor.connection.execute(
+        'SELECT frame_id, class_id, confidence, x1, y1, x2, y2, track_id FROM boxes ORDER BY frame_id, rowid'
+    )
+    updates = []
+    for frame_id, frame_rows in groupby(rows, key=lambda row: row[0]):
+        frame_rows = list(frame_rows)
+        data = np.array([row[1:7] for row in frame_rows], dtype=np.float64)
+        track_ids = [row[7] for row in frame_rows]
+        track_id = None if None in track_ids else track_ids
+        updates.append((encode_boxes(DetectionBatch(data[:, 2:], data[:, 1], data[:, 0], None, track_id)), frame_id))
+        if len(updates) >= 1000:
+            cursor.executemany('UPDATE frames SET boxes = ? WHERE id = ?', updates)
+            updates = []
+    cursor.executemany('UPDATE frames SET boxes = ? WHERE id = ?', updates)
+    cursor.execute('DROP TABLE boxes')
+
+def _drop_unordered_indexes(cursor, class_ids):
+    """Version 4: drop the indexes replaced by the keyset-ordered ones in INDEXES"""
+    cursor.execute('DROP INDEX IF EXISTS idx_frames_source_ts')
+    cursor.execute('DROP INDEX IF EXISTS idx_region_counts_region_ts')
+
+def _drop_region_counts_key(cursor, class_ids):
+    """Version 5: drop the covering index of unfiltered region_counts scans (they join frames now)"""
+    cursor.execute('DROP INDEX IF EXISTS idx_region_counts_key')
+
+# Migrations by the version they upgrade to, applied in order
+MIGRATIONS = [
+    (1, _migrate_legacy_detections),
+    (2, _backfill_rollups),
+    (3, _pack_boxes),
+    (4, _drop_unordered_indexes),
+    (5, _drop_region_counts_key)
+]
+
+def initialize_schema(conn, class_ids=None):
+    """
+    Create the tables and indexes and migrate older databases
+    
+    Args:
+        conn: sqlite3 connection
+        class_ids: Optional {class name: class id} used to migrate legacy records
+    """
+    # New databases release free pages with PRAGMA incremental_vacuum (retention)
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    with conn:
+        cursor = conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        
+        for table in TABLES:
+            cursor.execute(table)
+        for index in INDEXES:
+            cursor.execute(index)
+        
+        for target_version, migrate in MIGRATIONS:
+            if version < target_version:
+                migrate(cursor, class_ids)
+        
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
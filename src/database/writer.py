@@ -0,0 +1,171 @@
+import time
+import queue
+import atexit
+import logging
+import threading
+
+class DetectionWriter:
+    """
+    Background writer that group-commits detection records
+    
+    save_detection() only queues the record. A dedicated thread collects
+    records until batch_rows are waiting or batch_ms have passed since the
+    first one, then writes them in a single transaction. When the queue is
+    full, the caller waits (overflow: block, nothing is lost) or the record
+    is dropped (overflow: drop). flush() returns once every record queued
+    before it is committed. The writer's connection can use its own
+    synchronous level: group commits make FULL durability affordable.
+    """
+    def __init__(self, db_manager, writer_config):
+        self.db_manager = db_manager
+        self.batch_rows = writer_config.get('batch_rows', 64)
+        self.batch_ms = writer_config.get('batch_ms', 200)
+        self.overflow = writer_config.get('overflow', 'block')
+        self.synchronous = writer_config.get('synchronous')
+        self.logger = logging.getLogger('DetectionWriter')
+        
+        self.queue = queue.Queue(maxsize=writer_config.get('queue_size', 1024))
+        self.condition = threading.Condition()
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.transactions = 0
+        self.max_queue_depth = 0
+        self.closed = False
+        # Held while checking closed and queueing, so nothing is queued after the stop sentinel
+        self.submit_lock = threading.Lock()
+        
+        self.thread = threading.Thread(target=self._run, name='DetectionWriter', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+    
+    def submit(self, record):
+        """Queue an (epoch ms, analysis_results, detections, video_source) record"""
+        with self.submit_lock:
+            if not self.closed:
+                try:
+                    if self.overflow == 'drop':
+                        self.queue.put_nowait(record)
+                    else:
+                        self.queue.put(record)
+                except queue.Full:
+                    with self.condition:
+                        self.dropped += 1
+                    return
+                
+                with self.condition:
+                    self.submitted += 1
+                    self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+                return
+        
+        # Closed: write directly
+        self.db_manager.save_detections([record])
+    
+    def _run(self):
+        """Collect records and commit them in groups until closed"""
+        if self.synchronous:
+            self.db_manager._connection().execute(f'PRAGMA synchronous={self.synchronous}')
+        
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            
+            # Group: up to batch_rows records, or whatever arrives within batch_ms
+            batch = [record]
+            deadline = time.monotonic() + self.batch_ms / 1000
+            stop = False
+            while len(batch) < self.batch_rows:
+                remaining = deadline - time.monotonic()
+                try:
+                    record = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            
+            try:
+                self.db_manager.save_detections(batch)
+                written, failed = len(batch), 0
+            except Exception as e:
+                self.logger.error(f"Error writing {len(batch)} detection records: {e}")
+                written, failed = 0, len(batch)
+            
+            with self.condition:
+                self.written += written
+                self.failed += failed
+                self.transactions += 1
+                self.condition.notify_all()
+            
+            if stop:
+                return
+    
+    def queue_depth(self):
+        """Number of records waiting to be written"""
+        return self.queue.qsize()
+    
+    def metrics(self):
+        """Writer counters and the current and maximum queue depth"""
+        with self.condition:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'max_queue_depth': self.max_queue_depth,
+                'submitted': self.submitted,
+                'written': self.written,
+                'failed': self.failed,
+                'dropped': self.dropped,
+                'transactions': self.transactions
+            }
+    
+    def flush(self, timeout=None):
+        """
+        Wait until all records queued so far are committed
+        
+        Returns:
+            True if they were committed (or failed) within the timeout
+        """
+        with self.condition:
+            target = self.submitted
+            return self.condition.wait_for(lambda: self.written + self.failed >= target, timeout)
+    
+    def close(self, timeout=None):
+        """Commit the queued records and stop the writer thread"""
+        with self.submit_lock:
+            if self.closed:
+                return
+            self.closed = True
+        
+        # The sentinel waits for room only while the thread is still draining the queue
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            return
+        
+        # Records left behind when the thread ended early are written here
+        leftovers = []
+        while True:
+            try:
+                record = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if record is not None:
+                leftovers.append(record)
+        if leftovers:
+            try:
+                self.db_manager.save_detections(leftovers)
+                written, failed = len(leftovers), 0
+            except Exception as e:
+                self.logger.error(f"Error writing {len(leftovers)} detection records: {e}")
+                written, failed = 0, len(leftovers)
+            with self.condition:
+                self.written += written
+                self.failed += failed
+                self.condition.notify_all()
@@ -0,0 +1,266 @@
+import os
+import threading
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+# Defaults used by Ultralytics for YOLOv8 post-processing
+NMS_IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+MAX_BOX_SIZE = 7680
+
+class TorchBackend:
+    """Run the model through Ultralytics/PyTorch"""
+    name = 'torch'
+    
+    def __init__(self, model_name, threads=0):
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        
+        try:
+            self.model = YOLO(model_name)
+            print(f"Successfully loaded model: {model_name}")
+        except Exception as e:
+            print(f"Error loading model {model_name}: {e}")
+            print("Falling back to yolov8n.pt")
+            self.model = YOLO("yolov8n.pt")
+        
+        # The Ultralytics predictor keeps per-call state, so calls are serialized
+        self.lock = threading.Lock()
+    
+    def predict(self, frames, conf, classes, imgsz=640):
+        """
+        Run inference on a list of frames
+        
+        Returns:
+            List of N x 6 arrays of [x1, y1, x2, y2, conf, class_id] rows, one per frame
+        """
+        with self.lock:
+            results = self.model(frames, conf=conf, classes=classes, imgsz=imgsz)
+        return [result.boxes.data.cpu().numpy() for result in results]
+
+class ExportedBackend:
+    """
+    Base class for backends running an exported YOLOv8 model
+    
+    The model is exported with Ultralytics on first use and the artifact is
+    cached next to the weights. Pre- and post-processing (letterbox, NMS)
+    are done here so the runtime only sees a normalized NCHW batch.
+    """
+    name = None
+    export_format = None
+    
+    def __init__(self, model_name, threads=0, imgsz=640):
+        self.imgsz = imgsz
+        self.threads = threads
+        self.model_path = self._export(model_name)
+        self._load(self.model_path)
+        print(f"Successfully loaded {self.name} model: {self.model_path}")
+    
+    def _artifact_path(self, model_name):
+        """Path the exported artifact is cached at"""
+        raise NotImplementedError
+    
+    def _load(self, model_path):
+        """Create the runtime session for the exported model"""
+        raise NotImplementedError
+    
+    def _run(self, blob):
+        """Run the runtime on an NCHW float32 batch and return the raw output"""
+        raise NotImplementedError
+    
+    def _export(self, model_name):
+        """Export the weights unless a cached artifact already exists"""
+        artifact_path = self._artifact_path(model_name)
+        if os.path.exists(artifact_path):
+            return artifact_path
+        
+        print(f"Exporting {model_name} to {self.name} (first use)...")
+        exported = str(YOLO(model_name).export(format=self.export_format, imgsz=self.imgsz, dynamic=True))
+        return artifact_path if os.path.exists(artifact_path) else self._artifact_path(exported)
+    
+    def predict(self, frames, conf, classes, imgsz=None):
+        """
+        Run inference on a list of frames
+        
+        Returns:
+            List of N x 6 arrays of [x1, y1, x2, y2, conf, class_id] rows, one per frame
+        """
+        imgsz = imgsz or self.imgsz
+        images = []
+        transforms = []
+        for frame in frames:
+            image, gain, pad = letterbox(to_bgr(frame), imgsz)
+            images.append(image)
+            transforms.append((gain, pad, frame.shape[:2]))
+        
+        blob = cv2.dnn.blobFromImages(images, 1 / 255.0, swapRB=True)
+        output = self._run(blob)
+        
+        return [postprocess(prediction, conf, classes, gain, pad, shape)
+                for prediction, (gain, pad, shape) in zip(output, transforms)]
+
+class OnnxBackend(ExportedBackend):
+    """Run an exported ONNX model through ONNX Runtime on the CPU"""
+    name = 'onnx'
+    export_format = 'onnx'
+    
+    def _artifact_path(self, model_name):
+        return os.path.splitext(model_name)[0] + '.onnx'
+    
+    def _load(self, model_path):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ImportError("The onnx backend requires onnxruntime: pip install onnxruntime")
+        
+        options = ort.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+    
+    def _run(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+class OpenVinoBackend(ExportedBackend):
+    """Run an exported OpenVINO IR model on the CPU"""
+    name = 'openvino'
+    export_format = 'openvino'
+    
+    def _artifact_path(self, model_name):
+        if model_name.endswith('.xml'):
+            return model_name
+        stem = os.path.splitext(model_name)[0].rstrip(os.sep)
+        if stem.endswith('_openvino_model'):
+            stem = stem[:-len('_openvino_model')]
+        return os.path.join(f"{stem}_openvino_model", os.path.basename(stem) + '.xml')
+    
+    def _load(self, model_path):
+        try:
+            import openvino as ov
+        except ImportError:
+            raise ImportError("The openvino backend requires openvino: pip install openvino")
+        
+        config = {'INFERENCE_NUM_THREADS': self.threads} if self.threads else {}
+        core = ov.Core()
+        self.compiled_model = core.compile_model(core.read_model(model_path), 'CPU', config)
+        self.output = self.compiled_model.output(0)
+    
+    def _run(self, blob):
+        return self.compiled_model(blob)[self.output]
+
+BACKENDS = {
+    'torch': TorchBackend,
+    'onnx': OnnxBackend,
+    'openvino': OpenVinoBackend
+}
+
+def create_backend(detection_config):
+    """
+    Create the inference backend selected by the detection config
+    
+    Falls back to the PyTorch backend if the selected runtime cannot be loaded.
+    """
+    model_name = detection_config['model']
+    backend_name = detection_config.get('backend', 'torch')
+    threads = detection_config.get('threads', 0)
+    
+    if backend_name not in BACKENDS:
+        raise ValueError(f"Unknown detection backend: {backend_name}")
+    
+    if backend_name == 'torch':
+        return TorchBackend(model_name, threads)
+    
+    try:
+        return BACKENDS[backend_name](model_name, threads)
+    except Exception as e:
+        print(f"Error loading {backend_name} backend for {model_name}: {e}")
+        print("Falling back to torch backend")
+        return TorchBackend(model_name, threads)
+
+def to_bgr(frame):
+    """Convert grayscale or BGRA frames to 3-channel BGR"""
+    if frame.ndim == 2:
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    if frame.shape[2] == 4:
+        return cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR)
+    return frame
+
+def letterbox(image, size):
+    """
+    Resize an image to fit a size x size square keeping the aspect ratio
+    
+    Returns:
+        padded image, scale gain and (left, top) padding
+    """
+    height, width = image.shape[:2]
+    gain = min(size / height, size / width)
+    new_width, new_height = int(round(width * gain)), int(round(height * gain))
+    
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    
+    left = (size - new_width) // 2
+    top = (size - new_height) // 2
+    padded = np.full((size, size, 3), 114, dtype=np.uint8)
+    padded[top:top + new_height, left:left + new_width] = image
+    
+    return padded, gain, (left, top)
+
+def postprocess(prediction, conf, classes, gain, pad, shape):
+    """
+    Decode a raw YOLOv8 output of shape (4 + num_classes, anchors)
+    
+    Returns:
+        N x 6 array of [x1, y1, x2, y2, conf, class_id] rows in frame coordinates
+    """
+    prediction = prediction.T
+    scores = prediction[:, 4:]
+    class_ids = scores.argmax(axis=1)
+    confidences = scores[np.arange(len(scores)), class_ids]
+    
+    keep = confidences >= conf
+    if classes is not None:
+        keep &= np.isin(class_ids, classes)
+    if not keep.any():
+        return np.empty((0, 6), dtype=np.float32)
+    
+    boxes = prediction[keep, :4]
+    confidences = confidences[keep]
+    class_ids = class_ids[keep]
+    
+    xyxy = np.empty((len(boxes), 4), dtype=np.float32)
+    xyxy[:, :2] = boxes[:, :2] - boxes[:, 2:] / 2
+    xyxy[:, 2:] = boxes[:, :2] + boxes[:, 2:] / 2
+    
+    indices = class_aware_nms(xyxy, confidences, class_ids, NMS_IOU_THRESHOLD)[:MAX_DETECTIONS]
+    xyxy = xyxy[indices]
+    
+    # Undo the letterbox
+    xyxy[:, [0, 2]] -= pad[0]
+    xyxy[:, [1, 3]] -= pad[1]
+    xyxy /= gain
+    xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, shape[1])
+    xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, shape[0])
+    
+    return np.column_stack([xyxy, confidences[indices], class_ids[indices]]).astype(np.float32)
+
+def class_aware_nms(xyxy, scores, class_ids, iou_threshold):
+    """
+    Non-maximum suppression applied separately per class
+    
+    Returns:
+        Indices of the kept boxes, highest score first
+    """
+    if len(xyxy) == 0:
+        return np.empty(0, dtype=np.int64)
+    
+    # Shift boxes of different classes apart so they never overlap
+    offsets = np.asarray(class_ids, dtype=np.float32)[:, None] * MAX_BOX_SIZE
+    xywh = np.asarray(xyxy, dtype=np.float32).copy()
+    xywh[:, 2:] -= xywh[:, :2]
+    xywh[:, :2] += offsets
+    indices = cv2.dnn.NMSBoxes(xywh.tolist(), np.asarray(scores).tolist(), 0.0, iou_threshold)
+    return np.asarray(indices, dtype=np.int64).reshape(-1)
@@ -0,0 +1,133 @@
+import numpy as np
+
+def build_class_table(classes):
+    """
+    Build an id -> name lookup table from a {name: id} mapping
+    
+    Args:
+        classes: Dictionary mapping class names to model class ids
+        
+    Returns:
+        NumPy object array indexed by class id (None for unknown ids)
+    """
+    size = max(classes.values()) + 1 if classes else 0
+    table = np.full(size, None, dtype=object)
+    for name, class_id in classes.items():
+        table[class_id] = name
+    return table
+
+class DetectionBatch:
+    """
+    Detections of a single frame stored as NumPy columns
+    
+    Columns are xyxy (N x 4 int32), centers (N x 2 int32), conf (N float32)
+    and class_id (N int32), plus an optional track_id (N int64) set by the
+    tracker. Iterating or indexing yields the legacy detection dictionaries,
+    so code written for lists of dicts keeps working.
+    """
+    def __init__(self, xyxy, conf, class_id, class_names, track_id=None):
+        self.xyxy = np.asarray(xyxy, dtype=np.int32).reshape(-1, 4)
+        self.conf = np.asarray(conf, dtype=np.float32).reshape(-1)
+        self.class_id = np.asarray(class_id, dtype=np.int32).reshape(-1)
+        self.class_names = class_names
+        self.track_id = None if track_id is None else np.asarray(track_id, dtype=np.int64).reshape(-1)
+        self.centers = (self.xyxy[:, :2] + self.xyxy[:, 2:]) // 2
+    
+    @classmethod
+    def from_data(cls, data, class_names):
+        """Create from an N x 6 array of [x1, y1, x2, y2, conf, class_id] rows"""
+        data = np.asarray(data, dtype=np.float32).reshape(-1, 6)
+        return cls(data[:, :4].astype(np.int32), data[:, 4], data[:, 5].astype(np.int32), class_names)
+    
+    @classmethod
+    def from_dicts(cls, detections):
+        """Create from a list of legacy detection dictionaries"""
+        classes = {d['class_name']: d['class_id'] for d in detections if d.get('class_name') is not None}
+        track_id = None
+        if detections and all('track_id' in d for d in detections):
+            track_id = [d['track_id'] for d in detections]
+        return cls([d['bbox'] for d in detections],
+                   [d['confidence'] for d in detections],
+                   [d['class_id'] for d in detections],
+                   build_class_table(classes), track_id)
+    
+    @classmethod
+    def empty(cls, class_names=None):
+        """Create a batch without detections"""
+        if class_names is None:
+            class_names = np.empty(0, dtype=object)
+        return cls(np.empty((0, 4)), np.empty(0), np.empty(0), class_names)
+    
+    @property
+    def names(self):
+        """Class names of all detections as a NumPy object array"""
+        names = np.full(len(self), None, dtype=object)
+        known = self.class_id < len(self.class_names)
+        names[known] = self.class_names[self.class_id[known]]
+        return names
+    
+    def class_mask(self, class_name):
+        """Boolean mask of detections with the given class name"""
+        matches = np.flatnonzero(self.class_names == class_name)
+        return np.isin(self.class_id, matches)
+    
+    def count(self, class_name):
+        """Number of detections with the given class name"""
+        return int(np.count_nonzero(self.class_mask(class_name)))
+    
+    def select(self, mask):
+        """Return a new batch with the detections selected by a mask or index array"""
+        track_id = None if self.track_id is None else self.track_id[mask]
+        return DetectionBatch(self.xyxy[mask], self.conf[mask], self.class_id[mask], self.class_names, track_id)
+    
+    def with_track_ids(self, track_id):
+        """Return a copy of the batch with the given track ids"""
+        return DetectionBatch(self.xyxy, self.conf, self.class_id, self.class_names, track_id)
+    
+    def to_dicts(self):
+        """Convert to the legacy list of detection dictionaries"""
+        detections = [
+            {
+                'class_id': class_id,
+                'class_name': name,
+                'confidence': confidence,
+                'bbox': bbox,
+                'center': center
+            }
+            for class_id, name, confidence, bbox, center in zip(
+                self.class_id.tolist(), self.names.tolist(), self.conf.tolist(),
+                self.xyxy.tolist(), self.centers.tolist())
+        ]
+        if self.track_id is not None:
+            for detection, track_id in zip(detections, self.track_id.tolist()):
+                detection['track_id'] = track_id
+        return detections
+    
+    def __len__(self):
+        return len(self.class_id)
+    
+    def __iter__(self):
+        return iter(self.to_dicts())
+    
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            index = int(index)
+            class_id = int(self.class_id[index])
+            known = class_id < len(self.class_names)
+            detection = {
+                'class_id': class_id,
+                'class_name': self.class_names[class_id] if known else None,
+                'confidence': float(self.conf[index]),
+                'bbox': self.xyxy[index].tolist(),
+                'center': self.centers[index].tolist()
+            }
+            if self.track_id is not None:
+                detection['track_id'] = int(self.track_id[index])
+            return detection
+        return self.select(index)
+
+def as_detection_batch(detections):
+    """Return detections as a DetectionBatch, converting legacy dict lists"""
+    if isinstance(detections, DetectionBatch):
+        return detections
+    return DetectionBatch.from_dicts(detections)
@@ -1,68 +1,210 @@
 import cv2
+from itertools import groupby
 import numpy as np
-from ultralytics import YOLO
+
+from .backends import class_aware_nms
+from .registry import get_backend
+from .detection_batch import DetectionBatch, build_class_table
+
+# Box colors (BGR) picked by class id
+BOX_COLORS = [
+    (56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255),
+    (49, 210, 207), (10, 249, 72), (23, 204, 146), (134, 219, 61),
+    (52, 147, 26), (187, 212, 0), (168, 153, 44), (255, 194, 0)
+]
+
+# Default inference resolution and the model stride it is rounded to
+DEFAULT_IMGSZ = 640
+MODEL_STRIDE = 32
+
+# IoU above which boxes from overlapping crops are treated as the same object
+CROP_MERGE_IOU = 0.5
+
+def merge_crop_detections(crop_data):
+    """Merge N x 6 detection arrays from overlapping crops of the same frame"""
+    data = np.concatenate(crop_data)
+    keep = class_aware_nms(data[:, :4], data[:, 4], data[:, 5], CROP_MERGE_IOU)
+    return data[keep]
 
 class ObjectDetector:
     def __init__(self, config):
         self.config = config
-        self.model = None
+        self.backend = None
         self.confidence = config['detection']['confidence']
         self.classes = config['detection']['classes']
         self.class_ids = list(self.classes.values())
-        self._load_model(config['detection']['model'])
+        self.class_names = build_class_table(self.classes)
+        self.batch_size = config['detection'].get('batch_size', 8)
+        self.annotate = config['detection'].get('annotate', True)
+        self._load_model()
+        
+    def _load_model(self):
+        """Get the model backend from the process-wide registry"""
+        self.backend = get_backend(self.config['detection'])
+    
+    def get_imgsz(self, source_type=None):
+        """
+        Get the inference resolution for a source type
+        
+        detection.imgsz is either a single size or a mapping of source types
+        (image, video, webcam, stream) to sizes with an optional 'default'.
+        Sizes are rounded up to a multiple of the model stride.
         
-    def _load_model(self, model_name):
-        """Load the YOLO model"""
-        try:
-            self.model = YOLO(model_name)
-            print(f"Successfully loaded model: {model_name}")
-        except Exception as e:
-            print(f"Error loading model {model_name}: {e}")
-            print("Falling back to yolov8n.pt")
-            self.model = YOLO("yolov8n.pt")
+        Args:
+            source_type: Type of the input source, None for the default size
+            
+        Returns:
+            Inference size in pixels (longest side)
+        """
+        imgsz = self.config['detection'].get('imgsz', DEFAULT_IMGSZ)
+        if isinstance(imgsz, dict):
+            imgsz = imgsz.get(source_type, imgsz.get('default', DEFAULT_IMGSZ))
+        return -(-int(imgsz) // MODEL_STRIDE) * MODEL_STRIDE
+    
+    def _parse_data(self, data):
+        """Convert an N x 6 backend output into a DetectionBatch"""
+        return DetectionBatch.from_data(data, self.class_names)
         
-    def detect(self, frame):
+    def detect(self, frame, annotate=None, confidence=None, class_ids=None, rois=None, imgsz=None):
         """
         Detect objects in a frame
         
         Args:
             frame: Image as numpy array (BGR format)
+            annotate: Draw the detections (defaults to detection.annotate).
+                When False the input frame is returned untouched and can be
+                drawn later with render()
+            confidence: Confidence threshold for this call (defaults to self.confidence)
+            class_ids: Class ids to detect for this call (defaults to self.class_ids)
+            rois: Optional list of (x1, y1, x2, y2) pixel rectangles. When given,
+                only these crops are passed to the model
+            imgsz: Inference resolution for this call (defaults to get_imgsz())
             
         Returns:
-            detections: List of dictionaries with detection results
+            detections: DetectionBatch with detection results
             annotated_frame: Frame with bounding boxes drawn
         """
         if frame is None or frame.size == 0:
-            return [], frame
+            return DetectionBatch.empty(self.class_names), frame
+        
+        return self.detect_batch([frame], annotate=annotate, confidence=confidence, class_ids=class_ids,
+                                 rois=None if rois is None else [rois], imgsz=imgsz)[0]
+    
+    def detect_batch(self, frames, batch_size=None, annotate=None, confidence=None, class_ids=None, rois=None,
+                     imgsz=None):
+        """
+        Detect objects in several frames with batched model calls
+        
+        Frames may have different sizes. Frames (or crops) of the same size are
+        grouped, and every batch holds images of a single size, so the model
+        can letterbox them together. Crops are inferred at imgsz scaled by
+        their share of the frame's longest side, so they keep the pixel scale
+        of a full-frame pass and cost in proportion to the area they cover.
+        
+        Args:
+            frames: List of images as numpy arrays (BGR format)
+            batch_size: Images per model call (defaults to detection.batch_size)
+            annotate: Draw the detections (defaults to detection.annotate)
+            confidence: Confidence threshold for this call (defaults to self.confidence)
+            class_ids: Class ids to detect for this call (defaults to self.class_ids)
+            rois: Optional list with one entry per frame: None to run on the full
+                frame, or a list of (x1, y1, x2, y2) rectangles to run on crops
+            imgsz: Inference resolution for this call (defaults to get_imgsz())
+            
+        Returns:
+            List of (detections, annotated_frame) tuples in input order
+        """
+        batch_size = max(1, int(batch_size or self.batch_size))
+        settings = self._call_settings(confidence, class_ids)
+        imgsz = imgsz or self.get_imgsz()
+        
+        # Model inputs as (frame index, image, crop offset, inference size), skipping empty frames
+        inputs = []
+        valid = []
+        for i, frame in enumerate(frames):
+            if frame is None or frame.size == 0:
+                continue
+            valid.append(i)
+            
+            frame_rois = rois[i] if rois is not None else None
+            if frame_rois is None:
+                inputs.append((i, frame, (0, 0), imgsz))
+                continue
+            frame_long_side = max(frame.shape[:2])
+            for x1, y1, x2, y2 in frame_rois:
+                if x2 > x1 and y2 > y1:
+                    # Same pixel scale as the full frame, rounded up to the model stride
+                    crop_imgsz = -(-imgsz * max(x2 - x1, y2 - y1) // (frame_long_side * MODEL_STRIDE)) * MODEL_STRIDE
+                    inputs.append((i, frame[y1:y2, x1:x2], (x1, y1), min(crop_imgsz, imgsz)))
+        inputs.sort(key=lambda item: (item[1].shape, item[3]))
+        
+        # Batches of up to batch_size images, split where the image or inference size changes
+        chunks = []
+        for _, group in groupby(inputs, key=lambda item: (item[1].shape, item[3])):
+            group = list(group)
+            chunks.extend(group[start:start + batch_size] for start in range(0, len(group), batch_size))
+        
+        frame_data = [[] for _ in frames]
+        for chunk in chunks:
+            results = self.backend.predict([image for _, image, _, _ in chunk], *settings, imgsz=chunk[0][3])
             
-        results = self.model(frame, conf=self.confidence, classes=self.class_ids)
+            for (i, _, (x_offset, y_offset), _), data in zip(chunk, results):
+                if x_offset or y_offset:
+                    # Map crop boxes back to frame coordinates
+                    data = data.copy()
+                    data[:, [0, 2]] += x_offset
+                    data[:, [1, 3]] += y_offset
+                frame_data[i].append(data)
         
-        # Process results
-        detections = []
-        for result in results:
-            boxes = result.boxes.cpu().numpy()
-            for i, box in enumerate(boxes):
-                x1, y1, x2, y2 = box.xyxy[0].astype(int)
-                confidence = box.conf[0]
-                class_id = int(box.cls[0])
-                
-                # Get class name from class id
-                class_name = None
-                for name, id in self.classes.items():
-                    if id == class_id:
-                        class_name = name
-                        break
-                
-                detection = {
-                    'class_id': class_id,
-                    'class_name': class_name,
-                    'confidence': float(confidence),
-                    'bbox': [int(x1), int(y1), int(x2), int(y2)],
-                    'center': [int((x1 + x2) / 2), int((y1 + y2) / 2)]
-                }
-                detections.append(detection)
+        outputs = [(DetectionBatch.empty(self.class_names), frame) for frame in frames]
+        for i in valid:
+            if len(frame_data[i]) > 1:
+                detections = self._parse_data(merge_crop_detections(frame_data[i]))
+            elif frame_data[i]:
+                detections = self._parse_data(frame_data[i][0])
+            else:
+                detections = DetectionBatch.empty(self.class_names)
+            outputs[i] = (detections, self.maybe_render(frames[i], detections, annotate))
         
-        # Get annotated frame
-        annotated_frame = results[0].plot() if results and len(results) > 0 else frame
+        return outputs
+    
+    def _call_settings(self, confidence, class_ids):
+        """Per-call confidence and class ids, falling back to the detector defaults"""
+        return (self.confidence if confidence is None else confidence,
+                self.class_ids if class_ids is None else class_ids)
+    
+    def maybe_render(self, frame, detections, annotate=None):
+        """Render detections unless annotation is disabled (annotate=None uses detection.annotate)"""
+        if annotate is None:
+            annotate = self.annotate
+        return self.render(frame, detections) if annotate else frame
+    
+    def render(self, frame, detections):
+        """
+        Draw detections on a copy of a frame
+        
+        Args:
+            frame: Image as numpy array (BGR format)
+            detections: DetectionBatch returned by detect()
+            
+        Returns:
+            annotated_frame: Copy of the frame with bounding boxes drawn
+        """
+        annotated_frame = frame.copy()
+        for i, ((x1, y1, x2, y2), class_id, class_name, confidence) in enumerate(zip(
+                detections.xyxy.tolist(), detections.class_id.tolist(),
+                detections.names.tolist(), detections.conf.tolist())):
+            color = BOX_COLORS[class_id % len(BOX_COLORS)]
+            cv2.rectangle(annotated_frame, (x1, y1), (x2, y2), color, 2)
+            
+            label = f"{class_name or class_id} {confidence:.2f}"
+            if detections.track_id is not None:
+                label = f"#{detections.track_id[i]} {label}"
+            (text_width, text_height), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+            text_top = max(y1 - text_height - baseline, 0)
+            cv2.rectangle(annotated_frame, (x1, text_top), (x1 + text_width, text_top + text_height + baseline),
+                          color, -1)
+            cv2.putText(annotated_frame, label, (x1, text_top + text_height),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
         
-        return detections, annotated_frame
+        return annotated_frame
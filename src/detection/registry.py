@@ -0,0 +1,49 @@
+import threading
+import numpy as np
+
+from .backends import create_backend
+
+# Loaded backends shared by every detector in the process
+_backends = {}
+_lock = threading.Lock()
+
+def backend_key(detection_config):
+    """Registry key for a detection config: (model, backend, threads)"""
+    return (detection_config['model'],
+            detection_config.get('backend', 'torch'),
+            detection_config.get('threads', 0))
+
+def get_backend(detection_config, warmup=True):
+    """
+    Return the shared inference backend for a detection config
+    
+    The backend is created (and warmed up) on first request and reused
+    afterwards, so repeated detector construction does not reload weights.
+    
+    Args:
+        detection_config: The 'detection' section of the configuration
+        warmup: Run a dummy inference after loading
+        
+    Returns:
+        Inference backend instance
+    """
+    key = backend_key(detection_config)
+    with _lock:
+        backend = _backends.get(key)
+        if backend is None:
+            backend = create_backend(detection_config)
+            if warmup:
+                warm_up(backend, detection_config)
+            _backends[key] = backend
+    return backend
+
+def warm_up(backend, detection_config):
+    """Run one inference on a blank frame so the first real call is not slow"""
+    frame = np.zeros((640, 640, 3), dtype=np.uint8)
+    backend.predict([frame], detection_config['confidence'], None)
+    print(f"Warmed up {backend.name} backend for {detection_config['model']}")
+
+def clear():
+    """Drop all cached backends"""
+    with _lock:
+        _backends.clear()
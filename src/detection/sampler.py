@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+
+class MotionSampler:
+    """
+    Decide which frames of a video or live source need inference
+    
+    Each frame is compared against the last processed frame on a small
+    grayscale copy. A frame is processed when enough pixels changed, but
+    never more often than every min_interval frames and at least every
+    max_interval frames. With motion gating disabled it processes every
+    min_interval frames.
+    """
+    def __init__(self, config):
+        sampling = config['detection'].get('sampling', {})
+        self.motion = sampling.get('motion', True)
+        self.min_interval = max(1, sampling.get('min_interval', 5))
+        self.max_interval = max(self.min_interval, sampling.get('max_interval', 30))
+        self.threshold = sampling.get('threshold', 0.01)
+        self.pixel_delta = sampling.get('pixel_delta', 25)
+        self.downscale_width = sampling.get('downscale_width', 96)
+        self.reset()
+    
+    def reset(self):
+        """Forget the reference frame, the next frame will be processed"""
+        self.reference = None
+        self.frames_since_processed = None
+        self.last_motion = 0.0
+    
+    def _downscale(self, frame):
+        """Small blurred grayscale copy of a frame used for differencing"""
+        height, width = frame.shape[:2]
+        scale = self.downscale_width / width
+        small = cv2.resize(frame, (self.downscale_width, max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+    
+    def should_process(self, frame):
+        """
+        Check whether inference should run on this frame
+        
+        Args:
+            frame: Current frame (BGR format)
+            
+        Returns:
+            True if the frame should be processed, False to reuse the last result
+        """
+        first = self.frames_since_processed is None
+        if not first:
+            self.frames_since_processed += 1
+            if self.frames_since_processed < self.min_interval:
+                return False
+        
+        small = None
+        if self.motion:
+            small = self._downscale(frame)
+            if not first and self.frames_since_processed < self.max_interval:
+                changed = cv2.absdiff(small, self.reference) > self.pixel_delta
+                self.last_motion = np.count_nonzero(changed) / changed.size
+                if self.last_motion < self.threshold:
+                    return False
+        
+        # Make the current frame the new reference
+        self.reference = small
+        self.frames_since_processed = 0
+        return True
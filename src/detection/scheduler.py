@@ -0,0 +1,77 @@
+class ResolutionScheduler:
+    """
+    Choose the inference resolution for the frames of one source
+    
+    Without multi-scale scheduling every frame runs at the source's
+    configured resolution. With it, each frame first gets a fast pass at
+    detection.multiscale.fast_imgsz. The frame is run again at the full
+    resolution only if some region's count comes close to its max_count.
+    """
+    def __init__(self, detector, analyzer, source_type=None):
+        self.detector = detector
+        self.analyzer = analyzer
+        self.imgsz = detector.get_imgsz(source_type)
+        
+        multiscale = detector.config['detection'].get('multiscale', {})
+        self.enabled = multiscale.get('enabled', False)
+        self.fast_imgsz = min(multiscale.get('fast_imgsz', 320), self.imgsz)
+        self.escalate_ratio = multiscale.get('escalate_ratio', 0.8)
+        self.escalations = 0
+        self.frames = 0
+    
+    def needs_full_resolution(self, detections, frame):
+        """Check whether any region is close to its maximum count"""
+        frame_height, frame_width = frame.shape[:2]
+        counts = self.analyzer.count_regions(detections, frame_width, frame_height)
+        return any(count >= self.escalate_ratio * self.analyzer.regions[region]['max_count']
+                   for region, count in counts.items())
+    
+    def detect(self, frame, **kwargs):
+        """
+        Detect objects in a frame at the scheduled resolution
+        
+        Takes the same keyword arguments as ObjectDetector.detect (except imgsz).
+        
+        Returns:
+            detections: DetectionBatch with detection results
+            annotated_frame: Frame with bounding boxes drawn
+        """
+        return self.detect_batch([frame], rois=[kwargs.pop('rois', None)], **kwargs)[0]
+    
+    def detect_batch(self, frames, **kwargs):
+        """
+        Detect objects in several frames at the scheduled resolution
+        
+        Takes the same keyword arguments as ObjectDetector.detect_batch (except imgsz).
+        
+        Returns:
+            List of (detections, annotated_frame) tuples in input order
+        """
+        self.frames += len(frames)
+        if not self.enabled or self.fast_imgsz >= self.imgsz:
+            return self.detector.detect_batch(frames, imgsz=self.imgsz, **kwargs)
+        
+        # Fast pass without drawing, only escalated frames need a second pass
+        annotate = kwargs.pop('annotate', None)
+        rois = kwargs.pop('rois', None)
+        outputs = self.detector.detect_batch(frames, imgsz=self.fast_imgsz, annotate=False, rois=rois, **kwargs)
+        
+        escalated = {i for i, (detections, _) in enumerate(outputs)
+                     if frames[i] is not None and frames[i].size > 0
+                     and self.needs_full_resolution(detections, frames[i])}
+        self.escalations += len(escalated)
+        
+        if escalated:
+            escalated_indices = sorted(escalated)
+            full_outputs = self.detector.detect_batch(
+                [frames[i] for i in escalated_indices], imgsz=self.imgsz, annotate=annotate,
+                rois=None if rois is None else [rois[i] for i in escalated_indices], **kwargs)
+            for i, output in zip(escalated_indices, full_outputs):
+                outputs[i] = output
+        
+        # Draw the frames that kept their fast-pass detections
+        for i, (detections, frame) in enumerate(outputs):
+            if i not in escalated and frame is not None and frame.size > 0:
+                outputs[i] = (detections, self.detector.maybe_render(frame, detections, annotate))
+        
+        return outputs
@@ -1,7 +1,6 @@
 import streamlit as st
 import cv2
 import numpy as np
-import time
 import os
 import sys
 from PIL import Image
@@ -9,14 +8,35 @@ import pandas as pd
 from datetime import datetime
 import tempfile
 
-# Add parent directory to path
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Add project root directory to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from utils.config_loader import load_config
-from detection.detector import ObjectDetector
-from analysis.analyzer import RegionAnalyzer
-from alert.alerter import AlertManager
-from database.db_manager import DatabaseManager
+from src.utils.config_loader import load_config
+from src.detection.detector import ObjectDetector
+from src.detection.sampler import MotionSampler
+from src.detection.scheduler import ResolutionScheduler
+from src.analysis.analyzer import RegionAnalyzer
+from src.analysis.heatmap import HeatmapAccumulator
+from src.analysis.tracker import Tracker
+from src.alert.alerter import AlertManager
+from src.alert.dispatcher import AlertDispatcher
+from src.database.db_manager import DatabaseManager
+
+@st.cache_resource
+def load_components():
+    """Load configuration and the thread-safe components once per process (the model is warmed up on load)"""
+    config = load_config()
+    detector = ObjectDetector(config)
+    db_manager = DatabaseManager(config)
+    dispatcher = AlertDispatcher(config, db_manager)
+    return config, detector, db_manager, dispatcher
+
+def load_session_components(config, db_manager, dispatcher):
+    """Create the stateful components (tracks, statistics, alert rule state) once per browser session"""
+    if 'analyzer' not in st.session_state:
+        st.session_state.analyzer = RegionAnalyzer(config)
+        st.session_state.alerter = AlertManager(config, db_manager, dispatcher)
+    return st.session_state.analyzer, st.session_state.alerter
 
 def run_streamlit_app():
     st.set_page_config(
@@ -27,14 +47,9 @@ def run_streamlit_app():
     
     st.title("Campus Monitoring System")
     
-    # Load configuration
-    config = load_config()
-    
-    # Initialize components
-    detector = ObjectDetector(config)
-    analyzer = RegionAnalyzer(config)
-    alerter = AlertManager(config)
-    db_manager = DatabaseManager(config)
+    # Load configuration and shared components, then this session's analyzer and alerter
+    config, detector, db_manager, dispatcher = load_components()
+    analyzer, alerter = load_session_components(config, db_manager, dispatcher)
     
     # Sidebar for configuration
     with st.sidebar:
@@ -65,7 +80,6 @@ def run_streamlit_app():
         # Detection settings
         st.subheader("Detection Settings")
         confidence = st.slider("Confidence Threshold", 0.1, 1.0, float(config['detection']['confidence']), 0.05)
-        detector.confidence = confidence
         
         # Class selection
         st.subheader("Classes to Detect")
@@ -74,9 +88,8 @@ def run_streamlit_app():
             if st.checkbox(f"{name.capitalize()} (ID: {class_id})", value=True if name == 'person' else False):
                 selected_classes[name] = class_id
         
-        if selected_classes:
-            detector.classes = selected_classes
-            detector.class_ids = list(selected_classes.values())
+        # Settings are passed per call so the shared detector is never modified
+        class_ids = list(selected_classes.values()) if selected_classes else None
         
         # Process button
         st.subheader("Actions")
@@ -95,18 +108,20 @@ def run_streamlit_app():
                 image_np = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
             
             # Detect objects
-            detections, detection_frame = detector.detect(image_np)
+            scheduler = ResolutionScheduler(detector, analyzer, 'image')
+            detections, detection_frame = scheduler.detect(image_np, confidence=confidence, class_ids=class_ids,
+                                                           rois=analyzer.get_inference_rois(image_np))
             
-            # Analyze detections
+            # Analyze detections (the image is its own source, nothing carries over from earlier inputs)
+            analyzer.reset()
+            alerter.reset()
             analysis_results, analysis_frame = analyzer.analyze(detections, detection_frame)
             
             # Check for alerts
-            alerts = alerter.check_and_alert(analysis_results)
+            alerts = alerter.check_and_alert(analysis_results, uploaded_file.name)
             
             # Save to database
             db_manager.save_detection(analysis_results, detections, uploaded_file.name)
-            if alerts:
-                db_manager.save_alerts(alerts, uploaded_file.name)
             
             # Convert BGR back to RGB for display
             display_frame = cv2.cvtColor(analysis_frame, cv2.COLOR_BGR2RGB)
@@ -134,31 +149,41 @@ def run_streamlit_app():
             progress_bar = st.progress(0)
             batch_results = []
             
-            for i, file in enumerate(uploaded_files):
-                # Process image
-                image = Image.open(file)
-                image_np = np.array(image)
-                
-                # Convert RGB to BGR (OpenCV format)
-                if len(image_np.shape) == 3 and image_np.shape[2] == 3:
-                    image_np = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
+            batch_size = detector.batch_size
+            scheduler = ResolutionScheduler(detector, analyzer, 'image')
+            for start in range(0, len(uploaded_files), batch_size):
+                files = uploaded_files[start:start + batch_size]
+                images = []
                 
-                # Detect objects
-                detections, _ = detector.detect(image_np)
+                for file in files:
+                    image = Image.open(file)
+                    image_np = np.array(image)
+                    
+                    # Convert RGB to BGR (OpenCV format)
+                    if len(image_np.shape) == 3 and image_np.shape[2] == 3:
+                        image_np = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
+                    images.append(image_np)
                 
-                # Analyze detections
-                analysis_results, _ = analyzer.analyze(detections, image_np)
+                # Detect objects for the whole batch at once, the annotated frames are not shown
+                batch_outputs = scheduler.detect_batch(images, batch_size=batch_size, annotate=False,
+                                                       confidence=confidence, class_ids=class_ids,
+                                                       rois=[analyzer.get_inference_rois(image) for image in images])
                 
-                # Save results
-                batch_results.append({
-                    'filename': file.name,
-                    'total_people': analysis_results['total_people'],
-                    'regions': analysis_results['counts'],
-                    'anomalies': any(analysis_results['anomalies'].values())
-                })
+                for file, image_np, (detections, _) in zip(files, images, batch_outputs):
+                    # Analyze detections, each image on its own
+                    analyzer.reset()
+                    analysis_results, _ = analyzer.analyze(detections, image_np)
+                    
+                    # Save results
+                    batch_results.append({
+                        'filename': file.name,
+                        'total_people': analysis_results['total_people'],
+                        'regions': analysis_results['counts'],
+                        'anomalies': any(analysis_results['anomalies'].values())
+                    })
                 
                 # Update progress
-                progress_bar.progress((i + 1) / len(uploaded_files))
+                progress_bar.progress(min(start + batch_size, len(uploaded_files)) / len(uploaded_files))
             
             # Display batch results
             results_df = pd.DataFrame(batch_results)
@@ -198,9 +223,16 @@ def run_streamlit_app():
             # Process video frames
             frame_count = 0
             people_counts = []
+            processed_frames = []
             
-            # Process every 5th frame to speed up processing
-            process_every_n_frames = 5
+            # Only process frames where the scene changed enough
+            sampler = MotionSampler(config)
+            scheduler = ResolutionScheduler(detector, analyzer, 'video')
+            tracker = Tracker(config)
+            heatmap = HeatmapAccumulator(config, uploaded_file.name)
+            analyzer.reset()
+            alerter.reset()
+            last_frame = None
             
             while True:
                 ret, frame = cap.read()
@@ -210,22 +242,29 @@ def run_streamlit_app():
                 
                 frame_count += 1
                 
-                # Process every nth frame
-                if frame_count % process_every_n_frames == 0:
-                    # Detect objects
-                    detections, detection_frame = detector.detect(frame)
+                # Process frames selected by the motion sampler
+                if sampler.should_process(frame):
+                    # Detect objects (drawn after tracking, so the boxes show their track ids)
+                    detections, detection_frame = scheduler.detect(frame, annotate=not tracker.enabled,
+                                                                   confidence=confidence, class_ids=class_ids,
+                                                                   rois=analyzer.get_inference_rois(frame))
+                    if tracker.enabled:
+                        detections = tracker.update(detections, frame_count)
+                        detection_frame = detector.render(frame, detections)
                     
-                    # Analyze detections
-                    analysis_results, analysis_frame = analyzer.analyze(detections, detection_frame)
+                    # Analyze detections (statistics and alert rules follow the video time)
+                    video_time = frame_count / fps if fps > 0 else None
+                    analysis_results, analysis_frame = analyzer.analyze(detections, detection_frame, video_time)
+                    if heatmap.enabled:
+                        heatmap.update(detections, width, height, video_time)
+                        last_frame = frame
                     
                     # Check for alerts
-                    alerts = alerter.check_and_alert(analysis_results)
+                    alerts = alerter.check_and_alert(analysis_results, uploaded_file.name, video_time)
                     
-                    # Save to database (only save every 30th processed frame to avoid database bloat)
-                    if frame_count % (process_every_n_frames * 30) == 0:
+                    # Save to database (every processed frame with the background writer, otherwise every 30th)
+                    if db_manager.writer is not None or (len(people_counts) + 1) % 30 == 0:
                         db_manager.save_detection(analysis_results, detections, uploaded_file.name)
-                        if alerts:
-                            db_manager.save_alerts(alerts, uploaded_file.name)
                     
                     # Convert BGR to RGB for display
                     display_frame = cv2.cvtColor(analysis_frame, cv2.COLOR_BGR2RGB)
@@ -238,16 +277,22 @@ def run_streamlit_app():
                     
                     # Store people count
                     people_counts.append(analysis_results['total_people'])
+                    processed_frames.append(frame_count)
             
             # Clean up
             cap.release()
             os.unlink(video_path)
             
+            # Write the queued frames first, so the rows below follow them in id and time order
+            if db_manager.writer is not None:
+                db_manager.writer.flush()
+            
             # Save video stats
             if people_counts:
                 avg_people = sum(people_counts) / len(people_counts)
                 duration = total_frames / fps if fps > 0 else 0
                 db_manager.save_video_stats(uploaded_file.name, total_frames, duration, avg_people)
+                db_manager.save_line_crossings(analysis_results.get('lines'), uploaded_file.name)
             
             # Display summary
             st.subheader("Video Processing Summary")
@@ -261,10 +306,15 @@ def run_streamlit_app():
                 # Plot people count over time
                 st.subheader("People Count Over Time")
                 chart_data = pd.DataFrame({
-                    'Frame': range(0, len(people_counts) * process_every_n_frames, process_every_n_frames),
+                    'Frame': processed_frames,
                     'People Count': people_counts
                 })
                 st.line_chart(chart_data.set_index('Frame'))
+            
+            if last_frame is not None:
+                st.subheader("Occupancy Heatmap")
+                heatmap.save_snapshot()
+                st.image(cv2.cvtColor(heatmap.render(last_frame), cv2.COLOR_BGR2RGB), use_column_width=True)
     
     elif source_type == "Webcam" and process_button:
         # Open webcam
@@ -279,6 +329,14 @@ def run_streamlit_app():
             # Create stop button
             stop_webcam = st.button("Stop Webcam")
             
+            # Skip inference while the scene is static, the last result stays on screen
+            sampler = MotionSampler(config)
+            scheduler = ResolutionScheduler(detector, analyzer, 'webcam')
+            tracker = Tracker(config)
+            analyzer.reset()
+            alerter.reset()
+            frame_count = 0
+            
             while not stop_webcam and not stop_button:
                 ret, frame = cap.read()
                 
@@ -286,23 +344,29 @@ def run_streamlit_app():
                     st.error("Error reading from webcam")
                     break
                 
-                # Detect objects
-                detections, detection_frame = detector.detect(frame)
+                frame_count += 1
+                if not sampler.should_process(frame):
+                    continue
+                
+                # Detect objects (drawn after tracking, so the boxes show their track ids)
+                detections, detection_frame = scheduler.detect(frame, annotate=not tracker.enabled,
+                                                               confidence=confidence, class_ids=class_ids,
+                                                               rois=analyzer.get_inference_rois(frame))
+                if tracker.enabled:
+                    detections = tracker.update(detections, frame_count)
+                    detection_frame = detector.render(frame, detections)
                 
                 # Analyze detections
                 analysis_results, analysis_frame = analyzer.analyze(detections, detection_frame)
                 
                 # Check for alerts
-                alerts = alerter.check_and_alert(analysis_results)
+                alerts = alerter.check_and_alert(analysis_results, f"webcam_{camera_id}")
                 
                 # Convert BGR to RGB for display
                 display_frame = cv2.cvtColor(analysis_frame, cv2.COLOR_BGR2RGB)
                 
                 # Update video display
                 video_placeholder.image(display_frame, caption="Live Feed", use_column_width=True)
-                
-                # Add a small delay
-                time.sleep(0.1)
             
             # Clean up
             cap.release()
@@ -320,6 +384,14 @@ def run_streamlit_app():
             # Create stop button
             stop_stream = st.button("Stop Stream")
             
+            # Skip inference while the scene is static, the last result stays on screen
+            sampler = MotionSampler(config)
+            scheduler = ResolutionScheduler(detector, analyzer, 'stream')
+            tracker = Tracker(config)
+            analyzer.reset()
+            alerter.reset()
+            frame_count = 0
+            
             while not stop_stream and not stop_button:
                 ret, frame = cap.read()
                 
@@ -327,23 +399,29 @@ def run_streamlit_app():
                     st.error("Error reading from RTSP stream")
                     break
                 
-                # Detect objects
-                detections, detection_frame = detector.detect(frame)
+                frame_count += 1
+                if not sampler.should_process(frame):
+                    continue
+                
+                # Detect objects (drawn after tracking, so the boxes show their track ids)
+                detections, detection_frame = scheduler.detect(frame, annotate=not tracker.enabled,
+                                                               confidence=confidence, class_ids=class_ids,
+                                                               rois=analyzer.get_inference_rois(frame))
+                if tracker.enabled:
+                    detections = tracker.update(detections, frame_count)
+                    detection_frame = detector.render(frame, detections)
                 
                 # Analyze detections
                 analysis_results, analysis_frame = analyzer.analyze(detections, detection_frame)
                 
                 # Check for alerts
-                alerts = alerter.check_and_alert(analysis_results)
+                alerts = alerter.check_and_alert(analysis_results, rtsp_url)
                 
                 # Convert BGR to RGB for display
                 display_frame = cv2.cvtColor(analysis_frame, cv2.COLOR_BGR2RGB)
                 
                 # Update video display
                 video_placeholder.image(display_frame, caption="RTSP Stream", use_column_width=True)
-                
-                # Add a small delay
-                time.sleep(0.1)
             
             # Clean up
             cap.release()
@@ -0,0 +1,41 @@
+from collections import OrderedDict
+
+class LRUCache:
+    """
+    Dictionary-like cache holding at most maxsize entries
+    
+    Reading or writing an entry marks it as recently used. When the cache
+    is full, the least recently used entry is dropped.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+    
+    def get(self, key, default=None):
+        """Get an entry (marking it as recently used) or default"""
+        if key not in self.entries:
+            return default
+        self.entries.move_to_end(key)
+        return self.entries[key]
+    
+    def __getitem__(self, key):
+        value = self.get(key, self)
+        if value is self:
+            raise KeyError(key)
+        return value
+    
+    def __setitem__(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+    
+    def __contains__(self, key):
+        return key in self.entries
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def clear(self):
+        """Drop all entries"""
+        self.entries.clear()